@@ -11,32 +11,35 @@ import asyncio
 import json
 import click
 from rich.console import Console
-from rich.table import Table
-from rich.panel import Panel
-from rich.syntax import Syntax
-from rich.markdown import Markdown
 from datetime import datetime
+from typing import TYPE_CHECKING
 
-from config.settings import settings
-from src.models.schemas import (
-    BugInput, 
-    ErrorInfo, 
-    BugContext, 
-    EnvironmentInfo,
-    BugSource,
-    BugSeverity,
-    HistoryCase,
-    CaseProblem,
-    CaseResolution,
-    FixType
-)
-from src.service import DebugAgentService
+# 重量级模块（服务、数据模型、rich 组件）在各命令内部按需导入，
+# 这样 --help 等命令不必加载 chromadb / openai / pydantic
+if TYPE_CHECKING:
+    from src.service import DebugAgentService
 
-console = Console()
+# 关闭自动高亮：结果文本不再逐段做正则高亮匹配
+console = Console(highlight=False)
 
 
-def get_service() -> DebugAgentService:
+def install_uvloop():
+    """使用 uvloop 事件循环（随 uvicorn[standard] 安装；Windows 等不可用时沿用默认循环）"""
+    try:
+        import uvloop
+    except ImportError:
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+
+def get_service() -> "DebugAgentService":
     """获取服务实例"""
+    from config.settings import get_settings
+    from config.log_config import setup_logging
+    from src.service import DebugAgentService
+    
+    settings = get_settings()
+    setup_logging(settings.log_level, settings.log_file)
     if not settings.openai_api_key:
         console.print("[red]Error: OPENAI_API_KEY not set. Please configure in .env file[/red]")
         sys.exit(1)
@@ -45,7 +48,24 @@ def get_service() -> DebugAgentService:
         openai_api_key=settings.openai_api_key,
         llm_model=settings.llm_model,
         openai_base_url=settings.openai_base_url,
-        chroma_persist_dir=settings.chroma_persist_dir
+        chroma_persist_dir=settings.chroma_persist_dir,
+        embedding_cache_path=settings.embedding_cache_path,
+        analysis_history_path=settings.analysis_history_path,
+        analysis_history_size=settings.analysis_history_size,
+        embedding_backend=settings.embedding_backend,
+        embedding_model=settings.embedding_model,
+        tei_url=settings.tei_url,
+        verify_ssl=settings.verify_ssl,
+        vector_backend=settings.vector_backend,
+        faiss_index_type=settings.faiss_index_type,
+        binary_log_patterns=settings.binary_log_patterns,
+        response_cache_size=settings.response_cache_size,
+        response_cache_threshold=settings.response_cache_threshold,
+        exact_cache_size=settings.exact_cache_size,
+        exact_cache_ttl=settings.exact_cache_ttl,
+        llm_batch_size=settings.llm_batch_size,
+        llm_batch_wait_ms=settings.llm_batch_wait_ms,
+        pattern_fast_path_threshold=settings.pattern_fast_path_threshold
     )
 
 
@@ -64,6 +84,9 @@ def cli():
 @click.option('--output', '-o', type=click.Choice(['rich', 'json']), default='rich', help='输出格式')
 def analyze(error: str, stack: str, trace_id: str, description: str, severity: str, output: str):
     """分析 Bug"""
+    from rich.panel import Panel
+    from src.models.schemas import BugInput, ErrorInfo, BugContext, EnvironmentInfo, BugSource, BugSeverity
+    
     console.print("\n[bold blue]🔍 Debug Agent - Bug 分析[/bold blue]\n")
     
     # 构建输入
@@ -84,6 +107,7 @@ def analyze(error: str, stack: str, trace_id: str, description: str, severity: s
     
     with console.status("[bold green]正在分析...[/bold green]"):
         service = get_service()
+        install_uvloop()
         result = asyncio.run(service.analyze_bug(bug_input))
     
     # 输出结果
@@ -95,6 +119,12 @@ def analyze(error: str, stack: str, trace_id: str, description: str, severity: s
 
 def display_result(result):
     """富文本显示分析结果"""
+    from rich.table import Table
+    from rich.panel import Panel
+    from rich.text import Text
+    from rich.console import Group
+    from rich.syntax import Syntax
+    
     # 总结
     console.print(Panel(
         f"[bold]{result.summary}[/bold]",
@@ -125,15 +155,17 @@ def display_result(result):
         ))
     
     # 修复建议
+    # 直接拼装 Text，不经过 Markdown 解析；LLM 输出按纯文本显示，其中的方括号不会被当作标记
     fix = result.fix_suggestion
-    fix_content = f"[bold]类型:[/bold] {fix.fix_type.value}\n\n{fix.description}"
+    fix_parts = [Text.assemble(("类型:", "bold"), f" {fix.fix_type.value}\n\n{fix.description}")]
     if fix.code_diff:
-        fix_content += f"\n\n[bold]代码修改:[/bold]\n```diff\n{fix.code_diff}\n```"
+        fix_parts.append(Text("\n代码修改:", style="bold"))
+        fix_parts.append(Syntax(fix.code_diff, "diff", background_color="default"))
     if fix.test_verification:
-        fix_content += f"\n\n[bold]验证方法:[/bold] {fix.test_verification}"
+        fix_parts.append(Text.assemble("\n", ("验证方法:", "bold"), f" {fix.test_verification}"))
     
     console.print(Panel(
-        Markdown(fix_content.replace("[bold]", "**").replace("[/bold]", "**")),
+        Group(*fix_parts),
         title="💡 修复建议",
         border_style="yellow"
     ))
@@ -184,6 +216,8 @@ def display_result(result):
 @click.option('--tags', help='标签，逗号分隔')
 def add_case(title: str, description: str, root_cause: str, fix: str, fix_type: str, tags: str):
     """添加历史 Case 到知识库"""
+    from src.models.schemas import HistoryCase, CaseProblem, CaseResolution, FixType
+    
     console.print("\n[bold blue]📝 添加历史 Case[/bold blue]\n")
     
     case = HistoryCase(
@@ -210,6 +244,8 @@ def add_case(title: str, description: str, root_cause: str, fix: str, fix_type:
 @cli.command()
 def stats():
     """查看知识库统计"""
+    from rich.table import Table
+    
     console.print("\n[bold blue]📊 知识库统计[/bold blue]\n")
     
     service = get_service()
@@ -229,54 +265,68 @@ def stats():
 @cli.command()
 def interactive():
     """交互式分析模式"""
+    from src.models.schemas import BugInput, ErrorInfo, BugContext, BugSource
+    
     console.print("\n[bold blue]🤖 Debug Agent 交互模式[/bold blue]")
     console.print("[dim]输入 'quit' 或 'exit' 退出[/dim]\n")
     
     service = get_service()
     
-    while True:
-        try:
-            error_msg = console.input("[bold yellow]请输入错误信息:[/bold yellow] ")
-            
-            if error_msg.lower() in ['quit', 'exit', 'q']:
-                console.print("[dim]👋 再见！[/dim]")
+    # 整个交互会话复用同一个事件循环，LLM 客户端的连接池可以跨查询复用
+    install_uvloop()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    
+    try:
+        while True:
+            try:
+                error_msg = console.input("[bold yellow]请输入错误信息:[/bold yellow] ")
+                
+                if error_msg.lower() in ['quit', 'exit', 'q']:
+                    console.print("[dim]👋 再见！[/dim]")
+                    break
+                
+                if not error_msg.strip():
+                    continue
+                
+                # 可选：堆栈信息
+                stack = console.input("[dim]堆栈信息（可选，直接回车跳过）:[/dim] ") or None
+                
+                # 可选：描述
+                desc = console.input("[dim]问题描述（可选，直接回车跳过）:[/dim] ") or None
+                
+                bug_input = BugInput(
+                    source=BugSource.MANUAL,
+                    error_info=ErrorInfo(
+                        error_message=error_msg,
+                        stack_trace=stack
+                    ),
+                    context=BugContext(user_description=desc) if desc else None
+                )
+                
+                with console.status("[bold green]正在分析...[/bold green]"):
+                    result = loop.run_until_complete(service.analyze_bug(bug_input))
+                
+                display_result(result)
+                console.print("\n" + "="*60 + "\n")
+                
+            except KeyboardInterrupt:
+                console.print("\n[dim]👋 再见！[/dim]")
                 break
-            
-            if not error_msg.strip():
-                continue
-            
-            # 可选：堆栈信息
-            stack = console.input("[dim]堆栈信息（可选，直接回车跳过）:[/dim] ") or None
-            
-            # 可选：描述
-            desc = console.input("[dim]问题描述（可选，直接回车跳过）:[/dim] ") or None
-            
-            bug_input = BugInput(
-                source=BugSource.MANUAL,
-                error_info=ErrorInfo(
-                    error_message=error_msg,
-                    stack_trace=stack
-                ),
-                context=BugContext(user_description=desc) if desc else None
-            )
-            
-            with console.status("[bold green]正在分析...[/bold green]"):
-                result = asyncio.run(service.analyze_bug(bug_input))
-            
-            display_result(result)
-            console.print("\n" + "="*60 + "\n")
-            
-        except KeyboardInterrupt:
-            console.print("\n[dim]👋 再见！[/dim]")
-            break
-        except Exception as e:
-            console.print(f"[red]分析出错: {e}[/red]")
+            except Exception as e:
+                console.print(f"[red]分析出错: {e}[/red]")
+    finally:
+        loop.close()
 
 
 @cli.command()
 def serve():
     """启动 API 服务"""
     import uvicorn
+    from config.settings import get_settings
+    
+    settings = get_settings()
+    
     console.print(f"\n[bold blue]🚀 启动 Debug Agent API 服务[/bold blue]")
     console.print(f"[dim]地址: http://{settings.api_host}:{settings.api_port}[/dim]")
     console.print(f"[dim]文档: http://{settings.api_host}:{settings.api_port}/docs[/dim]\n")
@@ -285,7 +335,9 @@ def serve():
         "main:app",
         host=settings.api_host,
         port=settings.api_port,
-        reload=settings.debug
+        reload=settings.debug,
+        loop="auto",  # 已安装 uvloop 时使用 uvloop，否则退回 asyncio
+        http="auto"   # 已安装 httptools 时使用 httptools 解析 HTTP
     )
 
 
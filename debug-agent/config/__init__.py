@@ -1,4 +1,5 @@
 """配置模块"""
-from .settings import settings
+from .settings import Settings, get_settings
+from .log_config import setup_logging
 
-__all__ = ["settings"]
+__all__ = ["Settings", "get_settings", "setup_logging"]
@@ -0,0 +1,50 @@
+"""
+日志配置 - 记录日志只是放入队列，格式化和写入由后台线程完成，不阻塞事件循环
+"""
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+from typing import Optional
+
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging(level: str = "INFO", log_file: Optional[str] = None) -> QueueListener:
+    """
+    配置根 logger：输出到标准错误，配置了 log_file 时同时写入文件
+
+    重复调用时复用已启动的监听线程；进程退出时自动停止并写完队列中剩余的日志。
+
+    Args:
+        level: 日志级别
+        log_file: 日志文件路径（None 表示不写文件）
+
+    Returns:
+        后台写日志的 QueueListener
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        Path(log_file).parent.mkdir(parents=True, exist_ok=True)
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(log_queue)]
+    root.setLevel(level.upper())
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
@@ -1,9 +1,10 @@
 """
 Debug Agent 配置管理
 """
-from pydantic_settings import BaseSettings
+from functools import lru_cache
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field
-from typing import Optional
+from typing import Optional, Literal
 from pathlib import Path
 
 
@@ -24,13 +25,35 @@ class Settings(BaseSettings):
     openai_base_url: Optional[str] = Field(default=None, env="OPENAI_BASE_URL")
     llm_model: str = Field(default="gpt-4-turbo-preview", env="LLM_MODEL")
     embedding_model: str = Field(default="text-embedding-3-small", env="EMBEDDING_MODEL")
+    # embedding 后端：minilm 为本地 all-MiniLM-L6-v2（无 API 调用），openai 使用 EMBEDDING_MODEL
+    # 注意：切换后端会改变向量维度，需要重建知识库
+    embedding_backend: Literal["openai", "minilm", "sentence_transformers", "tei"] = Field(default="minilm", env="EMBEDDING_BACKEND")
+    # tei 后端：text-embeddings-inference 服务地址（模型和设备由服务端配置，如 GPU 上的 all-MiniLM-L6-v2）
+    tei_url: str = Field(default="http://localhost:8080", env="TEI_URL")
     verify_ssl: bool = Field(default=False, env="VERIFY_SSL")  # SSL 证书验证（公司代理可能需要禁用）
+    # 并发分析请求合并为一次 LLM 调用：最多 llm_batch_size 个 Bug，最长等待 llm_batch_wait_ms 毫秒
+    llm_batch_size: int = Field(default=8, env="LLM_BATCH_SIZE")  # 1 表示不合并
+    llm_batch_wait_ms: int = Field(default=50, env="LLM_BATCH_WAIT_MS")
+    # 日志模式匹配分数达到该值且堆栈中没有业务代码时，跳过 LLM 直接按模式给出结果（大于 1 表示禁用）
+    pattern_fast_path_threshold: float = Field(default=0.9, env="PATTERN_FAST_PATH_THRESHOLD")
     
     # 向量数据库配置
     chroma_persist_dir: str = "./data/chroma"
+    # 文档 embedding 缓存（按内容哈希，历史 Case 和代码索引共用）
+    embedding_cache_path: str = Field(default="./data/embed_cache.sqlite", env="EMBEDDING_CACHE_PATH")
+    # 向量后端：chroma 或 faiss（代码片段、历史 Case、日志模式三个集合均使用 FAISS 索引）
+    vector_backend: Literal["chroma", "faiss"] = Field(default="chroma", env="VECTOR_BACKEND")
+    # faiss 后端的索引类型：flat（float32 精确检索）、sq8（int8 量化粗筛 + float32 精排）、
+    # hnsw（图近似检索）或 hnsw_sq8（图近似检索，节点只保存 int8 编码）
+    faiss_index_type: Literal["flat", "sq8", "hnsw", "hnsw_sq8"] = Field(default="flat", env="FAISS_INDEX_TYPE")
+    # faiss 后端下日志模式集合是否使用二值量化（符号位 + 汉明距离），不影响其他集合
+    binary_log_patterns: bool = Field(default=False, env="BINARY_LOG_PATTERNS")
     
     # 数据库配置
     database_url: str = "sqlite+aiosqlite:///./data/debug_agent.db"
+    # 分析历史：全部结果写入 SQLite，内存中只保留最近使用的 analysis_history_size 条
+    analysis_history_path: str = Field(default="./data/analyses.sqlite", env="ANALYSIS_HISTORY_PATH")
+    analysis_history_size: int = Field(default=1000, env="ANALYSIS_HISTORY_SIZE")
     
     # 知识库配置
     code_repo_path: Optional[str] = None  # copilot-server 代码路径
@@ -41,14 +64,34 @@ class Settings(BaseSettings):
     retrieval_top_k: int = 5
     similarity_threshold: float = 0.7
     
+    # 语义响应缓存：检索查询（含业务代码根帧）与近期分析过的问题余弦相似度达到阈值时直接复用结果，知识库更新后清空
+    response_cache_size: int = Field(default=1024, env="RESPONSE_CACHE_SIZE")  # 0 表示禁用
+    response_cache_threshold: float = Field(default=0.95, env="RESPONSE_CACHE_THRESHOLD")
+    
+    # 精确响应缓存：Bug 内容（不含 bug_id、时间戳）完全相同时，TTL 内直接复用结果
+    exact_cache_size: int = Field(default=512, env="EXACT_CACHE_SIZE")  # 0 表示禁用
+    exact_cache_ttl: int = Field(default=900, env="EXACT_CACHE_TTL")  # 秒
+    
     # 日志配置
     log_level: str = "INFO"
     log_file: Optional[str] = "./logs/debug_agent.log"
     
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
+    # 配置加载后不可修改（各模块共享同一实例）
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        frozen=True
+    )
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """获取全局配置（首次调用时读取环境变量和 .env，之后复用同一实例）"""
+    return Settings()
 
 
-# 全局配置实例
-settings = Settings()
+def __getattr__(name: str):
+    """兼容 `from config.settings import settings`：首次访问时才加载配置"""
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
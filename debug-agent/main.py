@@ -9,9 +9,14 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from config.settings import settings
+from config.settings import get_settings
+from config.log_config import setup_logging
+
+settings = get_settings()
+setup_logging(settings.log_level, settings.log_file)
 from src.api.routes import router, set_service
 from src.service import DebugAgentService
 
@@ -26,9 +31,27 @@ async def lifespan(app: FastAPI):
         openai_api_key=settings.openai_api_key,
         llm_model=settings.llm_model,
         openai_base_url=settings.openai_base_url,
-        chroma_persist_dir=settings.chroma_persist_dir
+        chroma_persist_dir=settings.chroma_persist_dir,
+        embedding_cache_path=settings.embedding_cache_path,
+        analysis_history_path=settings.analysis_history_path,
+        analysis_history_size=settings.analysis_history_size,
+        embedding_backend=settings.embedding_backend,
+        embedding_model=settings.embedding_model,
+        tei_url=settings.tei_url,
+        verify_ssl=settings.verify_ssl,
+        vector_backend=settings.vector_backend,
+        faiss_index_type=settings.faiss_index_type,
+        binary_log_patterns=settings.binary_log_patterns,
+        response_cache_size=settings.response_cache_size,
+        response_cache_threshold=settings.response_cache_threshold,
+        exact_cache_size=settings.exact_cache_size,
+        exact_cache_ttl=settings.exact_cache_ttl,
+        llm_batch_size=settings.llm_batch_size,
+        llm_batch_wait_ms=settings.llm_batch_wait_ms,
+        pattern_fast_path_threshold=settings.pattern_fast_path_threshold
     )
     set_service(service)
+    await service.warmup()
     
     # 打印知识库统计
     stats = service.get_knowledge_stats()
@@ -38,6 +61,8 @@ async def lifespan(app: FastAPI):
     
     # 关闭时清理
     print("👋 Shutting down...")
+    await service.flush_history_cases()
+    service.close()
 
 
 # 创建 FastAPI 应用
@@ -45,7 +70,8 @@ app = FastAPI(
     title=settings.app_name,
     version=settings.app_version,
     description="自动化 Debug 分析系统 - 基于 RAG + LLM 的智能 Bug 分析",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse  # 所有接口默认使用 orjson 序列化
 )
 
 # CORS 配置
@@ -84,5 +110,7 @@ if __name__ == "__main__":
         "main:app",
         host=settings.api_host,
         port=settings.api_port,
-        reload=settings.debug
+        reload=settings.debug,
+        loop="auto",  # 已安装 uvloop 时使用 uvloop，否则退回 asyncio
+        http="auto"   # 已安装 httptools 时使用 httptools 解析 HTTP
     )
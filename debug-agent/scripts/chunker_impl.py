@@ -0,0 +1,104 @@
+"""
+Python 代码按行切分的实现（无 tree-sitter 时的回退路径）
+
+本模块只使用带完整类型注解的简单代码，可以用 mypyc 编译为 C 扩展：
+
+    cd scripts && mypyc chunker_impl.py
+
+编译产物（chunker_impl.*.so / .pyd）与本文件同目录时会被优先导入；未编译时按普通 Python 模块运行，结果一致。
+"""
+from typing import List, Dict, Any
+
+
+DEF_PREFIXES = ('def ', 'class ', 'async def ')
+BLOCK_CONTINUE_PREFIXES = ('def ', 'class ', 'async def ', '@')
+
+
+def _indent_of(line: str) -> int:
+    """行首空白字符数"""
+    return len(line) - len(line.lstrip())
+
+
+def chunk_python_lines(lines: List[str], min_chunk_size: int) -> List[Dict[str, Any]]:
+    """
+    按函数/类定义切分 Python 代码行
+
+    Args:
+        lines: 代码行（不含换行符）
+        min_chunk_size: 最小块大小（字符数），更小的块被丢弃
+
+    Returns:
+        代码块列表，每个包含 content, start_line, end_line, type
+    """
+    chunks: List[Dict[str, Any]] = []
+    current_chunk_lines: List[str] = []
+    # 当前块的字符总数（不含换行符）和是否包含 def，避免反复 join 整个块
+    current_chars: int = 0
+    current_has_def: bool = False
+    current_start_line: int = 1
+    in_class_or_func: bool = False
+    indent_level: int = 0
+
+    i: int = 0
+    for line in lines:
+        i += 1
+        stripped = line.strip()
+
+        # 检测函数或类定义
+        if stripped.startswith(DEF_PREFIXES):
+            # 保存之前的块（'\n'.join 后的长度 = 字符数 + 行数 - 1）
+            if current_chunk_lines and current_chars + len(current_chunk_lines) - 1 >= min_chunk_size:
+                chunks.append({
+                    'content': '\n'.join(current_chunk_lines),
+                    'start_line': current_start_line,
+                    'end_line': i - 1,
+                    'type': 'function' if current_has_def else 'code'
+                })
+
+            current_chunk_lines = [line]
+            current_chars = len(line)
+            current_has_def = 'def ' in line
+            current_start_line = i
+            in_class_or_func = True
+            indent_level = _indent_of(line)
+
+        elif in_class_or_func:
+            current_chunk_lines.append(line)
+            current_chars += len(line)
+            if not current_has_def and 'def ' in line:
+                current_has_def = True
+
+            # 检测块是否结束（遇到同级或更低缩进的非空行）
+            if stripped and not stripped.startswith('#'):
+                if _indent_of(line) <= indent_level and not stripped.startswith(BLOCK_CONTINUE_PREFIXES):
+                    # 块结束（长度按包含当前行计算，内容不含当前行）
+                    if current_chars + len(current_chunk_lines) - 1 >= min_chunk_size:
+                        chunks.append({
+                            'content': '\n'.join(current_chunk_lines[:-1]),
+                            'start_line': current_start_line,
+                            'end_line': i - 1,
+                            'type': 'function'
+                        })
+                    current_chunk_lines = [line]
+                    current_chars = len(line)
+                    current_has_def = 'def ' in line
+                    current_start_line = i
+                    in_class_or_func = False
+        else:
+            current_chunk_lines.append(line)
+            current_chars += len(line)
+            if not current_has_def and 'def ' in line:
+                current_has_def = True
+
+    # 保存最后一个块
+    if current_chunk_lines and current_chars + len(current_chunk_lines) - 1 >= min_chunk_size:
+        chunks.append({
+            'content': '\n'.join(current_chunk_lines),
+            'start_line': current_start_line,
+            'end_line': len(lines),
+            'type': 'code'
+        })
+
+    if chunks:
+        return chunks
+    return [{'content': '\n'.join(lines), 'start_line': 1, 'end_line': len(lines), 'type': 'file'}]
@@ -4,12 +4,22 @@
 import sys
 from pathlib import Path
 import os
+import re
+import mmap
+import fnmatch
 import hashlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))  # chunker_impl（可能是 mypyc 编译产物）
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+import pathspec
+from config.settings import get_settings
 from src.storage.vector_store import VectorStore
+from src.storage.embedding_cache import EmbeddingCache
+from chunker_impl import chunk_python_lines
 
 
 # 支持的代码文件扩展名
@@ -33,21 +43,104 @@ CODE_EXTENSIONS = {
     '.swift': 'swift',
 }
 
+# 文件大小限制（字节），超出范围的文件不读取
+MAX_FILE_SIZE = 100_000
+MIN_FILE_SIZE = 10
+
+# 二进制文件检测读取的头部字节数
+BINARY_SNIFF_SIZE = 4096
+
+# tree-sitter 语法名（未列出的扩展名退回整文件切分）
+TREE_SITTER_GRAMMARS = {
+    '.py': 'python',
+    '.js': 'javascript',
+    '.jsx': 'javascript',
+    '.ts': 'typescript',
+    '.tsx': 'tsx',
+    '.go': 'go',
+    '.java': 'java',
+    '.rs': 'rust',
+    '.cpp': 'cpp',
+    '.c': 'c',
+    '.h': 'c',
+    '.hpp': 'cpp',
+    '.rb': 'ruby',
+    '.php': 'php',
+    '.scala': 'scala',
+    '.kt': 'kotlin',
+}
+
+# 作为独立代码片段的语法节点类型（函数、类等定义）
+DEFINITION_NODE_TYPES = frozenset({
+    # Python
+    'function_definition', 'class_definition', 'decorated_definition',
+    # JavaScript / TypeScript
+    'function_declaration', 'generator_function_declaration', 'class_declaration',
+    'method_definition', 'interface_declaration', 'enum_declaration',
+    'abstract_class_declaration', 'export_statement',
+    # Go
+    'method_declaration', 'type_declaration',
+    # Java / Kotlin / PHP
+    'constructor_declaration', 'object_declaration',
+    # Rust
+    'function_item', 'impl_item', 'struct_item', 'enum_item', 'trait_item', 'mod_item',
+    # C / C++
+    'class_specifier', 'struct_specifier', 'namespace_definition',
+    # Ruby
+    'method', 'singleton_method', 'class', 'module',
+    # Scala
+    'object_definition', 'trait_definition',
+})
+
+# 归类为 class 的定义节点关键字，其余定义归类为 function
+CLASS_NODE_KEYWORDS = (
+    'class', 'struct', 'interface', 'impl', 'trait', 'module',
+    'object', 'enum', 'namespace', 'type',
+)
+
+# 代码文件扩展名集合（遍历目录时的快速判断）
+CODE_EXT_KEYS = frozenset(CODE_EXTENSIONS)
+
 # 忽略的目录
-IGNORE_DIRS = {
+IGNORE_DIRS = frozenset({
     'node_modules', 'venv', '.venv', 'env', '.env',
     '__pycache__', '.git', '.svn', '.hg',
     'dist', 'build', 'target', 'out', 'bin',
     '.idea', '.vscode', '.pytest_cache',
     'vendor', 'packages', '.tox',
-}
+})
 
 # 忽略的文件模式
-IGNORE_FILES = {
+IGNORE_FILES = frozenset({
     '__init__.py',  # 通常是空的或只有导入
     'setup.py',
     'conftest.py',
-}
+})
+
+# 每个目录下读取的忽略规则文件（gitignore 语法）
+GITIGNORE_FILE = '.gitignore'
+# 仓库根目录下额外读取的忽略规则文件，用于排除已提交但不需要索引的文件
+DEBUGAGENT_IGNORE_FILE = '.debugagentignore'
+
+
+def _is_ignored(path: str, ignore_specs: Tuple[Tuple[int, pathspec.PathSpec], ...]) -> bool:
+    """判断路径是否被忽略（目录路径以 / 结尾）；规则由外到内，后面的规则可以用 ! 取消前面的忽略"""
+    ignored = False
+    for base_len, spec in ignore_specs:
+        result = spec.check_file(path[base_len:].replace(os.sep, '/'))
+        if result.include is not None:
+            ignored = result.include
+    return ignored
+
+
+def _load_ignore_spec(path: str) -> Optional[pathspec.PathSpec]:
+    """读取 gitignore 语法的忽略文件，文件不存在或没有规则时返回 None"""
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            spec = pathspec.PathSpec.from_lines('gitwildmatch', f)
+    except OSError:
+        return None
+    return spec if spec.patterns else None
 
 
 class CodeChunker:
@@ -62,6 +155,14 @@ class CodeChunker:
         self.max_chunk_size = max_chunk_size
         self.chunk_overlap = chunk_overlap
         self.min_chunk_size = min_chunk_size
+        
+        # tree-sitter 解析器按需加载（不可 pickle，不随实例传给工作进程）
+        self._parsers: Dict[str, Any] = {}
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_parsers'] = {}
+        return state
     
     def chunk_file(self, file_path: str, content: str) -> List[Dict[str, Any]]:
         """
@@ -78,7 +179,7 @@ class CodeChunker:
         language = CODE_EXTENSIONS.get(ext, 'text')
         
         # 先尝试按函数/类切分
-        chunks = self._chunk_by_structure(content, language)
+        chunks = self._chunk_by_structure(content, language, ext)
         
         # 如果结构切分失败或块太大，使用行切分
         final_chunks = []
@@ -98,9 +199,13 @@ class CodeChunker:
         
         return final_chunks
     
-    def _chunk_by_structure(self, content: str, language: str) -> List[Dict[str, Any]]:
+    def _chunk_by_structure(self, content: str, language: str, ext: str = '') -> List[Dict[str, Any]]:
         """按代码结构切分（函数、类等）"""
-        chunks = []
+        parser = self._get_parser(ext)
+        if parser is not None:
+            return self._chunk_by_syntax_tree(parser, content)
+        
+        # 没有可用的 tree-sitter 语法时退回按行扫描
         lines = content.split('\n')
         
         if language == 'python':
@@ -111,64 +216,122 @@ class CodeChunker:
         
         return chunks
     
-    def _chunk_python(self, lines: List[str]) -> List[Dict[str, Any]]:
-        """Python 代码切分"""
+    def _get_parser(self, ext: str):
+        """获取扩展名对应的 tree-sitter 解析器（按需加载并缓存）"""
+        grammar = TREE_SITTER_GRAMMARS.get(ext)
+        if grammar is None:
+            return None
+        
+        if grammar not in self._parsers:
+            try:
+                from tree_sitter_languages import get_parser
+                self._parsers[grammar] = get_parser(grammar)
+            except Exception:
+                # 未安装 tree_sitter_languages 或语法加载失败
+                self._parsers[grammar] = None
+        
+        return self._parsers[grammar]
+    
+    def _chunk_by_syntax_tree(self, parser, content: str) -> List[Dict[str, Any]]:
+        """使用 tree-sitter 语法树按定义切分"""
+        source = content.encode('utf-8')
+        tree = parser.parse(source)
+        
+        chunks = self._chunk_nodes(tree.root_node.children, source)
+        if chunks:
+            return chunks
+        
+        line_count = content.count('\n') + 1
+        return [{'content': content, 'start_line': 1, 'end_line': line_count, 'type': 'file'}]
+    
+    def _chunk_nodes(self, nodes, source: bytes, header_node=None) -> List[Dict[str, Any]]:
+        """
+        将同一层级的语法节点切分为代码片段
+        
+        定义节点各自成块，相邻的非定义节点（import、全局变量等）合并成一块；
+        超过 max_chunk_size 的定义如果内部还有定义（如类中的方法），继续向下拆分。
+        
+        Args:
+            nodes: 同层级的语法节点
+            source: 文件内容（UTF-8 字节）
+            header_node: 被拆分的外层定义，其头部（类声明等）并入第一个非定义块
+        """
         chunks = []
-        current_chunk_lines = []
-        current_start_line = 1
-        in_class_or_func = False
-        indent_level = 0
+        gap = [header_node] if header_node is not None else []
         
-        for i, line in enumerate(lines, 1):
-            stripped = line.strip()
+        for node in nodes:
+            if node.type not in DEFINITION_NODE_TYPES:
+                gap.append(node)
+                continue
             
-            # 检测函数或类定义
-            if stripped.startswith(('def ', 'class ', 'async def ')):
-                # 保存之前的块
-                if current_chunk_lines and len('\n'.join(current_chunk_lines)) >= self.min_chunk_size:
-                    chunks.append({
-                        'content': '\n'.join(current_chunk_lines),
-                        'start_line': current_start_line,
-                        'end_line': i - 1,
-                        'type': 'function' if 'def ' in '\n'.join(current_chunk_lines) else 'code'
-                    })
-                
-                current_chunk_lines = [line]
-                current_start_line = i
-                in_class_or_func = True
-                indent_level = len(line) - len(line.lstrip())
+            if gap:
+                chunks.append(self._gap_chunk(gap, node, source))
+                gap = []
             
-            elif in_class_or_func:
-                current_chunk_lines.append(line)
-                
-                # 检测块是否结束（遇到同级或更低缩进的非空行）
-                if stripped and not stripped.startswith('#'):
-                    current_indent = len(line) - len(line.lstrip())
-                    if current_indent <= indent_level and not stripped.startswith(('def ', 'class ', 'async def ', '@')):
-                        # 块结束
-                        if len('\n'.join(current_chunk_lines)) >= self.min_chunk_size:
-                            chunks.append({
-                                'content': '\n'.join(current_chunk_lines[:-1]),
-                                'start_line': current_start_line,
-                                'end_line': i - 1,
-                                'type': 'function'
-                            })
-                        current_chunk_lines = [line]
-                        current_start_line = i
-                        in_class_or_func = False
-            else:
-                current_chunk_lines.append(line)
-        
-        # 保存最后一个块
-        if current_chunk_lines and len('\n'.join(current_chunk_lines)) >= self.min_chunk_size:
-            chunks.append({
-                'content': '\n'.join(current_chunk_lines),
-                'start_line': current_start_line,
-                'end_line': len(lines),
-                'type': 'code'
-            })
+            if node.end_byte - node.start_byte > self.max_chunk_size:
+                body = self._find_nested_body(node)
+                if body is not None:
+                    chunks.extend(self._chunk_nodes(body.children, source, header_node=node))
+                    continue
+            
+            chunks.append(self._node_chunk(node, node.start_byte, node.end_byte, self._definition_type(node), source))
+        
+        if gap:
+            chunks.append(self._gap_chunk(gap, None, source))
         
-        return chunks if chunks else [{'content': '\n'.join(lines), 'start_line': 1, 'end_line': len(lines), 'type': 'file'}]
+        return chunks
+    
+    def _gap_chunk(self, gap: List[Any], next_node, source: bytes) -> Dict[str, Any]:
+        """合并相邻的非定义节点；外层定义的头部截止到下一个定义之前"""
+        first, last = gap[0], gap[-1]
+        end_byte = last.end_byte
+        end_node = last
+        if first is last and next_node is not None and first.end_byte > next_node.start_byte:
+            # 只有外层定义头部：截到下一个定义开始处
+            end_byte = next_node.start_byte
+            end_node = next_node
+        return self._node_chunk(first, first.start_byte, end_byte, 'code', source, end_node=end_node)
+    
+    def _node_chunk(
+        self,
+        node,
+        start_byte: int,
+        end_byte: int,
+        chunk_type: str,
+        source: bytes,
+        end_node=None
+    ) -> Dict[str, Any]:
+        """根据字节范围构建代码片段"""
+        end_node = end_node or node
+        end_line = end_node.end_point[0] + 1 if end_byte == end_node.end_byte else end_node.start_point[0]
+        return {
+            'content': source[start_byte:end_byte].decode('utf-8', errors='replace'),
+            'start_line': node.start_point[0] + 1,
+            'end_line': max(end_line, node.start_point[0] + 1),
+            'type': chunk_type
+        }
+    
+    def _find_nested_body(self, node):
+        """查找定义内部直接包含子定义的节点（如类体），找不到返回 None"""
+        queue = list(node.children)
+        while queue:
+            child = queue.pop(0)
+            if any(c.type in DEFINITION_NODE_TYPES for c in child.children):
+                return child
+            queue.extend(child.children)
+        return None
+    
+    def _definition_type(self, node) -> str:
+        """定义节点归类：class 或 function"""
+        if node.type in ('decorated_definition', 'export_statement') and node.children:
+            node = node.children[-1]
+        if any(keyword in node.type for keyword in CLASS_NODE_KEYWORDS):
+            return 'class'
+        return 'function'
+    
+    def _chunk_python(self, lines: List[str]) -> List[Dict[str, Any]]:
+        """Python 代码切分（实现在 chunker_impl，可用 mypyc 编译加速）"""
+        return chunk_python_lines(lines, self.min_chunk_size)
     
     def _chunk_generic(self, lines: List[str]) -> List[Dict[str, Any]]:
         """通用代码切分"""
@@ -182,22 +345,29 @@ class CodeChunker:
         }]
     
     def _chunk_by_lines(self, content: str, base_line: int = 1) -> List[Dict[str, Any]]:
-        """按行数切分大块"""
+        """按行数切分大块（基于换行符偏移直接切片，不拆分行列表）"""
         chunks = []
-        lines = content.split('\n')
+        
+        # offsets[i] 为第 i 行之前的换行符位置，第 i 行内容为 content[offsets[i] + 1:offsets[i + 1]]
+        offsets = [-1]
+        pos = content.find('\n')
+        while pos != -1:
+            offsets.append(pos)
+            pos = content.find('\n', pos + 1)
+        offsets.append(len(content))
+        line_count = len(offsets) - 1
         
         # 计算每块大约多少行
-        avg_line_length = len(content) / max(len(lines), 1)
+        avg_line_length = len(content) / max(line_count, 1)
         lines_per_chunk = int(self.max_chunk_size / max(avg_line_length, 1))
         lines_per_chunk = max(lines_per_chunk, 20)  # 至少20行
         
         overlap_lines = int(self.chunk_overlap / max(avg_line_length, 1))
         
         start = 0
-        while start < len(lines):
-            end = min(start + lines_per_chunk, len(lines))
-            chunk_lines = lines[start:end]
-            chunk_content = '\n'.join(chunk_lines)
+        while start < line_count:
+            end = min(start + lines_per_chunk, line_count)
+            chunk_content = content[offsets[start] + 1:offsets[end]]
             
             if len(chunk_content) >= self.min_chunk_size:
                 chunks.append({
@@ -207,7 +377,7 @@ class CodeChunker:
                     'type': 'chunk'
                 })
             
-            start = end - overlap_lines if end < len(lines) else end
+            start = end - overlap_lines if end < line_count else end
         
         return chunks
     
@@ -217,16 +387,75 @@ class CodeChunker:
         return hashlib.md5(content.encode()).hexdigest()[:16]
 
 
+# 工作进程内的切分器实例（由 _init_worker 设置）
+_worker_chunker: Optional[CodeChunker] = None
+
+
+def _init_worker(chunker: CodeChunker):
+    """工作进程初始化：保存切分器实例"""
+    global _worker_chunker
+    _worker_chunker = chunker
+
+
+def _read_and_chunk(
+    file_path: Path,
+    repo_path: Path
+) -> Tuple[str, List[Dict[str, Any]], Optional[str]]:
+    """
+    读取并切分单个文件（在工作进程中执行）
+    
+    Returns:
+        (相对路径, 代码片段列表, 错误信息)
+    """
+    rel_path = str(file_path.relative_to(repo_path))
+    try:
+        # 先按文件大小过滤，太大或太小的文件不读取
+        st_size = os.stat(file_path).st_size
+        if st_size > MAX_FILE_SIZE or st_size < MIN_FILE_SIZE:
+            return rel_path, [], None
+        
+        with open(file_path, 'rb') as f:
+            # 头部含 NUL 字节视为二进制文件
+            if b'\x00' in f.read(BINARY_SNIFF_SIZE):
+                return rel_path, [], None
+            
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                content = mm[:].decode('utf-8', errors='replace')
+        
+        # 跳过空白文件
+        if not content.strip():
+            return rel_path, [], None
+        
+        return rel_path, _worker_chunker.chunk_file(rel_path, content), None
+    except Exception as e:
+        return rel_path, [], str(e)
+
+
 class CodeIndexer:
     """代码索引器"""
     
     def __init__(
         self,
         vector_store: VectorStore,
-        chunker: Optional[CodeChunker] = None
+        chunker: Optional[CodeChunker] = None,
+        buffer_size: int = 256,
+        workers: Optional[int] = None,
+        embedding_cache: Optional[EmbeddingCache] = None
     ):
         self.vector_store = vector_store
         self.chunker = chunker or CodeChunker()
+        self.workers = workers or os.cpu_count() or 1
+        
+        # 按内容哈希缓存向量，重新索引时未变化的片段不再重复计算
+        self.embedding_cache = embedding_cache
+        
+        # 跨文件累积代码片段，凑满一批再统一写入，减少 embedding 调用次数
+        self._buffer: List[Dict[str, Any]] = []
+        self._buffer_size = buffer_size
+        
+        # 预编译的包含/排除文件模式（index_repository 时设置）
+        self._include_res: List[re.Pattern] = []
+        self._exclude_res: List[re.Pattern] = []
     
     def index_repository(
         self,
@@ -249,6 +478,10 @@ class CodeIndexer:
         if not repo_path.exists():
             raise ValueError(f"仓库路径不存在: {repo_path}")
         
+        # 文件模式只编译一次，遍历时直接匹配相对路径
+        self._include_res = [re.compile(fnmatch.translate(p)) for p in include_patterns or []]
+        self._exclude_res = [re.compile(fnmatch.translate(p)) for p in exclude_patterns or []]
+        
         stats = {
             'files_scanned': 0,
             'files_indexed': 0,
@@ -256,62 +489,104 @@ class CodeIndexer:
             'errors': 0
         }
         
-        # 遍历所有代码文件
-        for file_path in self._find_code_files(repo_path):
-            stats['files_scanned'] += 1
+        # 文件读取与切分并行执行，主进程只负责写入向量数据库
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.chunker,)
+        ) as executor:
+            results = executor.map(
+                _read_and_chunk,
+                self._find_code_files(repo_path),
+                itertools.repeat(repo_path),
+                chunksize=16
+            )
             
-            try:
-                # 读取文件内容
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
+            for rel_path, chunks, error in results:
+                stats['files_scanned'] += 1
                 
-                # 跳过空文件或太大的文件
-                if not content.strip() or len(content) > 100000:
+                if error:
+                    stats['errors'] += 1
+                    print(f"  ✗ {rel_path}: {error}")
                     continue
                 
-                # 切分代码
-                rel_path = str(file_path.relative_to(repo_path))
-                chunks = self.chunker.chunk_file(rel_path, content)
+                if not chunks:
+                    continue
                 
-                if chunks:
-                    # 索引到向量数据库
-                    self._index_chunks(chunks)
-                    stats['files_indexed'] += 1
-                    stats['chunks_created'] += len(chunks)
-                    
-                    print(f"  ✓ {rel_path} ({len(chunks)} chunks)")
-                    
-            except Exception as e:
-                stats['errors'] += 1
-                print(f"  ✗ {file_path}: {e}")
+                # 放入缓冲区，攒够一批后统一索引；写入失败的文件由 _flush 从统计中扣除
+                stats['files_indexed'] += 1
+                stats['chunks_created'] += len(chunks)
+                print(f"  ✓ {rel_path} ({len(chunks)} chunks)")
+                self._index_chunks(chunks, stats)
+        
+        # 写入剩余的片段
+        self._flush(stats)
         
         return stats
     
-    def _find_code_files(self, repo_path: Path) -> List[Path]:
-        """查找所有代码文件"""
-        code_files = []
+    def _find_code_files(
+        self,
+        repo_path: Path,
+        root_len: Optional[int] = None,
+        ignore_specs: Tuple[Tuple[int, pathspec.PathSpec], ...] = ()
+    ) -> Iterator[Path]:
+        """
+        查找所有代码文件（边遍历边产出，索引无需等待整棵目录树扫描完成）
         
-        for root, dirs, files in os.walk(repo_path):
-            # 过滤忽略的目录
-            dirs[:] = [d for d in dirs if d not in IGNORE_DIRS and not d.startswith('.')]
-            
-            for file in files:
-                if file in IGNORE_FILES:
-                    continue
-                
-                file_path = Path(root) / file
-                ext = file_path.suffix.lower()
-                
-                if ext in CODE_EXTENSIONS:
-                    code_files.append(file_path)
+        遵循各级目录的 .gitignore 以及仓库根目录的 .debugagentignore，
+        每条规则按其所在目录的相对路径匹配。
+        """
+        dir_path = str(repo_path)
+        if root_len is None:
+            root_len = len(dir_path) + 1
+            spec = _load_ignore_spec(os.path.join(dir_path, DEBUGAGENT_IGNORE_FILE))
+            if spec:
+                ignore_specs += ((root_len, spec),)
         
-        return code_files
+        spec = _load_ignore_spec(os.path.join(dir_path, GITIGNORE_FILE))
+        if spec:
+            ignore_specs += ((len(dir_path) + 1, spec),)
+        
+        include_res = self._include_res
+        exclude_res = self._exclude_res
+        
+        with os.scandir(repo_path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    # 过滤忽略的目录
+                    if entry.name in IGNORE_DIRS or entry.name.startswith('.'):
+                        continue
+                    if ignore_specs and _is_ignored(entry.path + '/', ignore_specs):
+                        continue
+                    yield from self._find_code_files(Path(entry.path), root_len, ignore_specs)
+                
+                elif entry.is_file():
+                    name = entry.name
+                    if name in IGNORE_FILES:
+                        continue
+                    
+                    # 直接在文件名上取扩展名，避免为每个文件构造 Path（与 Path.suffix 一致，忽略前导点）
+                    dot = name.rfind('.')
+                    if dot <= 0 or name[dot:].lower() not in CODE_EXT_KEYS:
+                        continue
+                    
+                    # 包含/排除模式匹配仓库内的相对路径（统一使用 / 分隔）
+                    if include_res or exclude_res:
+                        rel = entry.path[root_len:].replace(os.sep, '/')
+                        if exclude_res and any(r.match(rel) for r in exclude_res):
+                            continue
+                        if include_res and not any(r.match(rel) for r in include_res):
+                            continue
+                    
+                    if ignore_specs and _is_ignored(entry.path, ignore_specs):
+                        continue
+                    
+                    yield Path(entry.path)
     
-    def _index_chunks(self, chunks: List[Dict[str, Any]]):
-        """将代码片段索引到向量数据库"""
-        snippets = []
+    def _index_chunks(self, chunks: List[Dict[str, Any]], stats: Dict[str, int]):
+        """将代码片段放入缓冲区，缓冲区满时批量索引到向量数据库"""
         for chunk in chunks:
-            snippets.append({
+            self._buffer.append({
                 'id': chunk['id'],
                 'content': chunk['content'],
                 'metadata': {
@@ -323,22 +598,74 @@ class CodeIndexer:
                 }
             })
         
-        self.vector_store.add_code_snippets(snippets)
+        if len(self._buffer) >= self._buffer_size:
+            self._flush(stats)
+    
+    def _flush(self, stats: Dict[str, int]):
+        """
+        将缓冲区中的代码片段一次性写入向量数据库
+        
+        同一批中重复的 ID 只保留第一条（一次 add 中 ID 重复会整批失败）。整批写入失败时
+        按文件逐个重试，仍失败的文件计为错误并从已索引统计中扣除；无论成败缓冲区都会清空，
+        失败的片段不会拖累之后的批次。
+        """
+        if not self._buffer:
+            return
+        
+        unique: Dict[str, Dict[str, Any]] = {}
+        for snippet in self._buffer:
+            unique.setdefault(snippet['id'], snippet)
+        batch = list(unique.values())
+        try:
+            self._add_snippets(batch)
+        except Exception as e:
+            print(f"  ! 批量写入 {len(batch)} 个片段失败，按文件重试: {e}")
+            by_file: Dict[str, List[Dict[str, Any]]] = {}
+            for snippet in batch:
+                by_file.setdefault(snippet['metadata']['file_path'], []).append(snippet)
+            for file_path, snippets in by_file.items():
+                try:
+                    self._add_snippets(snippets)
+                except Exception as file_error:
+                    stats['errors'] += 1
+                    stats['files_indexed'] -= 1
+                    stats['chunks_created'] -= len(snippets)
+                    print(f"  ✗ {file_path}: {file_error}")
+        finally:
+            self._buffer = []
+    
+    def _add_snippets(self, snippets: List[Dict[str, Any]]):
+        """计算（或从缓存读取）向量并写入一批代码片段"""
+        embeddings = None
+        if self.embedding_cache is not None:
+            embeddings = self.embedding_cache.get_or_compute(
+                [s['content'] for s in snippets],
+                self.vector_store.embed_documents
+            )
+        
+        self.vector_store.add_code_snippets(snippets, embeddings=embeddings)
 
 
 def main():
     """主函数"""
     import argparse
     
+    settings = get_settings()
+    
     parser = argparse.ArgumentParser(description='索引代码仓到知识库')
     parser.add_argument('repo_path', nargs='?', help='代码仓路径')
     parser.add_argument('--clear', action='store_true', help='清空现有代码索引')
+    parser.add_argument('--batch-size', type=int, default=256, help='每批写入的代码片段数')
+    parser.add_argument('--workers', type=int, default=None, help='并行切分的进程数（默认 CPU 核数）')
+    parser.add_argument('--embed-cache', default=settings.embedding_cache_path, help='embedding 缓存文件路径')
+    parser.add_argument('--no-embed-cache', action='store_true', help='不使用 embedding 缓存')
+    parser.add_argument('--include', action='append', default=None, help='只索引匹配的相对路径（glob，可多次指定）')
+    parser.add_argument('--exclude', action='append', default=None, help='跳过匹配的相对路径（glob，可多次指定）')
     args = parser.parse_args()
     
     # 从环境变量或参数获取路径
     repo_path = args.repo_path
     if not repo_path:
-        from config.settings import settings
         repo_path = settings.code_repo_path
     
     if not repo_path:
@@ -350,16 +677,45 @@ def main():
     print(f"🚀 索引代码仓: {repo_path}\n")
     
     # 初始化
-    vector_store = VectorStore(persist_directory="./data/chroma")
+    vector_store = VectorStore(
+        persist_directory="./data/chroma",
+        embedding_backend=settings.embedding_backend,
+        openai_api_key=settings.openai_api_key,
+        openai_base_url=settings.openai_base_url,
+        embedding_model=settings.embedding_model,
+        tei_url=settings.tei_url,
+        vector_backend=settings.vector_backend,
+        faiss_index_type=settings.faiss_index_type,
+        binary_log_patterns=settings.binary_log_patterns
+    )
     
     # 清空现有索引
     if args.clear:
         print("🗑️  清空现有代码索引...")
         vector_store.clear_collection("code_snippets")
     
+    # embedding 缓存
+    embedding_cache = None
+    if not args.no_embed_cache:
+        embedding_cache = EmbeddingCache(args.embed_cache, namespace=vector_store.embedding_model)
+    
     # 索引代码
-    indexer = CodeIndexer(vector_store)
-    stats = indexer.index_repository(repo_path)
+    indexer = CodeIndexer(
+        vector_store,
+        buffer_size=args.batch_size,
+        workers=args.workers,
+        embedding_cache=embedding_cache
+    )
+    try:
+        stats = indexer.index_repository(
+            repo_path,
+            include_patterns=args.include,
+            exclude_patterns=args.exclude
+        )
+        vector_store.persist()
+    finally:
+        if embedding_cache is not None:
+            embedding_cache.close()
     
     # 打印统计
     print(f"\n📊 索引完成:")
@@ -367,6 +723,8 @@ def main():
     print(f"   - 索引文件: {stats['files_indexed']}")
     print(f"   - 创建片段: {stats['chunks_created']}")
     print(f"   - 错误: {stats['errors']}")
+    if embedding_cache is not None:
+        print(f"   - 缓存命中: {embedding_cache.hits} / {embedding_cache.hits + embedding_cache.misses}")
     
     # 总体统计
     all_stats = vector_store.get_stats()
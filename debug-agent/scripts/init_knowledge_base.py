@@ -2,11 +2,14 @@
 知识库初始化脚本 - 导入历史 Case 和预定义的日志模式
 """
 import sys
+import itertools
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+import orjson
 from datetime import datetime
+from config.settings import get_settings
 from src.storage.vector_store import VectorStore
 from src.models.schemas import (
     HistoryCase,
@@ -14,102 +17,33 @@ from src.models.schemas import (
     CaseResolution,
     FixType
 )
+from typing import List, Dict, Any, Iterable, Iterator
+
+
+# 每次写入向量数据库的最大条数
+BATCH_SIZE = 500
+
+# 预定义的日志错误模式，新增模式只需编辑该文件
+LOG_PATTERNS_FILE = Path(__file__).parent / "resources" / "log_patterns.jsonl"
+
+
+def batched(items: Iterable[Dict[str, Any]], size: int = BATCH_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """按固定大小分批"""
+    it = iter(items)
+    while batch := list(itertools.islice(it, size)):
+        yield batch
+
+
+def load_log_patterns(path: Path = LOG_PATTERNS_FILE) -> List[Dict[str, Any]]:
+    """读取日志错误模式资源文件（每行一个 JSON 对象）"""
+    return [orjson.loads(line) for line in path.read_bytes().splitlines() if line.strip()]
 
 
 def init_log_patterns(vector_store: VectorStore):
     """初始化常见日志错误模式"""
-    patterns = [
-        {
-            "id": "REDIS_TIMEOUT",
-            "pattern": "redis connection timeout redis.exceptions.TimeoutError Connection timed out",
-            "category": "DEPENDENCY_ERROR",
-            "severity": "P1",
-            "description": "Redis 连接超时",
-            "solution": "检查 Redis 服务状态，确认网络连通性，检查连接池配置"
-        },
-        {
-            "id": "REDIS_CONN_POOL",
-            "pattern": "redis connection pool exhausted no connection available",
-            "category": "DEPENDENCY_ERROR",
-            "severity": "P1",
-            "description": "Redis 连接池耗尽",
-            "solution": "增加连接池大小，检查是否有连接泄漏，优化连接使用"
-        },
-        {
-            "id": "LLM_RATE_LIMIT",
-            "pattern": "rate limit exceeded RateLimitError 429 too many requests openai",
-            "category": "DEPENDENCY_ERROR",
-            "severity": "P2",
-            "description": "LLM API 请求频率超限",
-            "solution": "实现请求限流，增加重试机制，考虑升级 API 配额"
-        },
-        {
-            "id": "LLM_TIMEOUT",
-            "pattern": "openai timeout request timed out APITimeoutError",
-            "category": "DEPENDENCY_ERROR",
-            "severity": "P2",
-            "description": "LLM API 请求超时",
-            "solution": "检查网络状况，调整超时配置，实现超时重试"
-        },
-        {
-            "id": "DB_CONN_ERROR",
-            "pattern": "database connection failed OperationalError could not connect to server",
-            "category": "DEPENDENCY_ERROR",
-            "severity": "P0",
-            "description": "数据库连接失败",
-            "solution": "检查数据库服务状态，确认连接配置，检查网络和防火墙"
-        },
-        {
-            "id": "NULL_POINTER",
-            "pattern": "NoneType object has no attribute AttributeError None",
-            "category": "LOGIC_ERROR",
-            "severity": "P2",
-            "description": "空指针异常",
-            "solution": "添加空值检查，确认数据来源，检查对象初始化逻辑"
-        },
-        {
-            "id": "KEY_ERROR",
-            "pattern": "KeyError key not found dict",
-            "category": "LOGIC_ERROR",
-            "severity": "P2",
-            "description": "字典键不存在",
-            "solution": "使用 .get() 方法，添加键存在性检查，确认数据结构"
-        },
-        {
-            "id": "AUTH_FAILED",
-            "pattern": "authentication failed unauthorized 401 invalid token",
-            "category": "API_ERROR",
-            "severity": "P2",
-            "description": "认证失败",
-            "solution": "检查 token 有效性，确认认证配置，检查时钟同步"
-        },
-        {
-            "id": "PERMISSION_DENIED",
-            "pattern": "permission denied forbidden 403 access denied",
-            "category": "API_ERROR",
-            "severity": "P2",
-            "description": "权限不足",
-            "solution": "检查用户权限配置，确认资源访问策略"
-        },
-        {
-            "id": "OOM_ERROR",
-            "pattern": "out of memory MemoryError cannot allocate memory",
-            "category": "PERFORMANCE",
-            "severity": "P0",
-            "description": "内存不足",
-            "solution": "检查内存泄漏，优化内存使用，考虑扩容"
-        },
-        {
-            "id": "CONFIG_MISSING",
-            "pattern": "configuration not found missing config environment variable not set",
-            "category": "CONFIG_ERROR",
-            "severity": "P1",
-            "description": "配置缺失",
-            "solution": "检查环境变量，确认配置文件，检查配置中心连接"
-        }
-    ]
-    
-    vector_store.add_log_patterns(patterns)
+    patterns = load_log_patterns()
+    for batch in batched(patterns):
+        vector_store.add_log_patterns(batch)
     print(f"✅ 已添加 {len(patterns)} 个日志错误模式")
 
 
@@ -178,11 +112,12 @@ def init_sample_cases(vector_store: VectorStore):
         )
     ]
     
-    for case in sample_cases:
-        embedding_text = case.generate_embedding_text()
-        vector_store.add_cases([{
+    # 先统一生成向量化文本和文档，再按批写入（每批一次 embedding + 索引写入）
+    texts = [case.embedding_text or case.generate_embedding_text() for case in sample_cases]
+    case_docs = [
+        {
             "id": case.case_id,
-            "content": embedding_text,
+            "content": text,
             "metadata": {
                 "title": case.problem.title,
                 "root_cause": case.resolution.root_cause,
@@ -192,22 +127,38 @@ def init_sample_cases(vector_store: VectorStore):
                 "resolver": case.resolver or "",
                 "created_at": case.created_at.isoformat()
             }
-        }])
+        }
+        for case, text in zip(sample_cases, texts)
+    ]
+    for batch in batched(case_docs):
+        vector_store.add_cases(batch)
     
     print(f"✅ 已添加 {len(sample_cases)} 个示例历史 Case")
 
 
 def main():
     """主函数"""
+    settings = get_settings()
     print("🚀 初始化 Debug Agent 知识库...\n")
     
-    vector_store = VectorStore(persist_directory="./data/chroma")
+    vector_store = VectorStore(
+        persist_directory="./data/chroma",
+        embedding_backend=settings.embedding_backend,
+        openai_api_key=settings.openai_api_key,
+        openai_base_url=settings.openai_base_url,
+        embedding_model=settings.embedding_model,
+        tei_url=settings.tei_url,
+        vector_backend=settings.vector_backend,
+        faiss_index_type=settings.faiss_index_type,
+        binary_log_patterns=settings.binary_log_patterns
+    )
     
     # 初始化日志模式
     init_log_patterns(vector_store)
     
     # 初始化示例 Case
     init_sample_cases(vector_store)
+    vector_store.persist()
     
     # 打印统计
     stats = vector_store.get_stats()
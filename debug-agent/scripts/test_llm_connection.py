@@ -6,9 +6,8 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 import asyncio
-import httpx
-from openai import AsyncOpenAI
 from config.settings import settings
+from src.core.llm_client import get_openai_client
 
 
 async def test_connection():
@@ -20,17 +19,15 @@ async def test_connection():
     print(f"Model: {settings.llm_model}")
     print()
     
-    # 创建自定义 HTTP 客户端，禁用 SSL 验证（解决证书问题）
-    http_client = httpx.AsyncClient(verify=False)
-    
-    client = AsyncOpenAI(
+    # 使用与服务相同的共享客户端和 SSL 配置
+    client = get_openai_client(
         api_key=settings.openai_api_key,
         base_url=settings.openai_base_url,
-        timeout=30.0,
-        http_client=http_client
-    )
+        verify_ssl=settings.verify_ssl
+    ).with_options(timeout=30.0)
     
-    print("⚠️  注意: SSL 验证已禁用（仅用于测试）\n")
+    if not settings.verify_ssl:
+        print("⚠️  注意: SSL 验证已禁用（VERIFY_SSL=false）\n")
     
     try:
         print("正在发送请求...")
@@ -2,7 +2,10 @@
 API 路由 - Bug 分析接口
 """
 from fastapi import APIRouter, HTTPException, BackgroundTasks
-from typing import Optional
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from typing import List, Optional
+
+import orjson
 
 from src.models.schemas import (
     BugInput,
@@ -67,10 +70,21 @@ async def get_analysis(analysis_id: str):
 
 
 @router.get("/analyses")
-async def list_analyses(limit: int = 20):
-    """列出最近的分析结果"""
+async def list_analyses(limit: int = 20, stream: bool = False):
+    """
+    列出最近的分析结果
+    
+    直接用 orjson 序列化 model_dump() 的结果，跳过 jsonable_encoder；
+    stream=true 时以 NDJSON（每行一个分析结果）流式返回。
+    """
     service = get_service()
-    return service.list_analyses(limit)
+    results = service.list_analyses(limit)
+    if stream:
+        return StreamingResponse(
+            (orjson.dumps(result.model_dump()) + b"\n" for result in results),
+            media_type="application/x-ndjson"
+        )
+    return ORJSONResponse([result.model_dump() for result in results])
 
 
 # ============ 反馈接口 ============
@@ -101,16 +115,24 @@ async def submit_feedback(feedback: AnalysisFeedback):
 
 # ============ 知识库管理接口 ============
 
-@router.post("/cases")
+@router.post("/cases", status_code=202)
 async def add_case(case: HistoryCase):
-    """添加历史 Case 到知识库"""
+    """添加历史 Case 到知识库（进入写入队列，稍后批量写入）"""
+    service = get_service()
+    await service.enqueue_history_case(case)
+    return {"status": "queued", "case_id": case.case_id}
+
+
+@router.post("/cases/batch")
+async def add_cases(cases: List[HistoryCase]):
+    """批量添加历史 Case 到知识库"""
     service = get_service()
-    service.add_history_case(case)
-    return {"status": "success", "case_id": case.case_id}
+    await service.run_write(service.add_history_cases, cases)
+    return {"status": "success", "count": len(cases)}
 
 
 @router.get("/stats")
-async def get_stats():
+def get_stats():
     """获取知识库统计"""
     service = get_service()
     return service.get_knowledge_stats()
@@ -1,14 +1,20 @@
 """
 LLM 分析模块 - Prompt 模板、分析链、结果解析
 """
-import json
 import re
-from typing import Dict, Any, Optional, List
+import json
+import asyncio
+import logging
+from string import Formatter
+from typing import Dict, Any, Optional, List, Callable, Mapping, Tuple, TypeVar, Annotated, Union
 from datetime import datetime
-import uuid
+import secrets
+from functools import lru_cache
 
-import httpx
-from openai import AsyncOpenAI
+import orjson
+import tiktoken
+from openai import BadRequestError, UnprocessableEntityError
+from pydantic import BaseModel, ConfigDict, TypeAdapter, ValidationError, ValidatorFunctionWrapHandler, WrapValidator
 
 from src.models.schemas import (
     AnalysisResult,
@@ -22,6 +28,12 @@ from src.models.schemas import (
     FixType
 )
 from src.core.retriever import RetrievalResult
+from src.core.preprocessor import ParsedStackTrace
+from src.core.batcher import MicroBatcher
+from src.core.llm_client import get_openai_client
+
+
+logger = logging.getLogger(__name__)
 
 
 # ============ Prompt 模板 ============
@@ -36,11 +48,8 @@ SYSTEM_PROMPT = """你是一个专业的后端服务 Debug 专家，专门负责
 
 请保持专业、准确、简洁。如果信息不足，请明确说明需要哪些额外信息。"""
 
-ANALYSIS_PROMPT_TEMPLATE = """## 分析任务
-
-请基于以下信息，按步骤分析这个 Bug：
-
-### 问题信息
+# 单个 Bug 的上下文（批量分析时每个 Bug 各一份）
+BUG_CONTEXT_TEMPLATE = """### 问题信息
 
 **错误类型**: {exception_type}
 **错误信息**: {error_message}
@@ -59,11 +68,10 @@ ANALYSIS_PROMPT_TEMPLATE = """## 分析任务
 
 ### 相关代码片段
 
-{code_snippets_section}
+{code_snippets_section}"""
 
----
-
-## 分析要求
+# 分析要求与输出格式（批量分析时所有 Bug 共用一份）
+ANALYSIS_REQUIREMENTS = """## 分析要求
 
 请按以下步骤进行分析：
 
@@ -103,25 +111,181 @@ ANALYSIS_PROMPT_TEMPLATE = """## 分析任务
     "additional_investigation": ["如果需要进一步排查，列出建议的排查步骤"]
 }}"""
 
+ANALYSIS_PROMPT_TEMPLATE = """## 分析任务
+
+请基于以下信息，按步骤分析这个 Bug：
+
+""" + BUG_CONTEXT_TEMPLATE + """
+
+---
+
+""" + ANALYSIS_REQUIREMENTS
+
+BATCH_ANALYSIS_PROMPT_TEMPLATE = """## 批量分析任务
+
+以下共有 {count} 个相互独立的 Bug，请逐个按步骤分析，不要混用不同 Bug 的信息。
+
+{bug_sections}
+
+---
+
+""" + ANALYSIS_REQUIREMENTS + """
+
+## 批量输出格式
+
+请输出一个 JSON 对象 {{"results": [...]}}，results 数组包含 {count} 个元素，
+按 Bug 编号顺序排列，每个元素都是上述格式的分析结果，并额外包含整数字段 "bug_index"（对应的 Bug 编号）。"""
+
+# 系统消息在所有请求间共享
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+
+def compile_template(template: str) -> Callable[[Mapping[str, str]], str]:
+    """
+    预先解析 str.format 模板，返回渲染函数
+    
+    模板只在模块加载时解析一次，渲染时直接拼接字面量和字段值（仅支持不带格式说明的 {name} 字段）。
+    """
+    literals: List[str] = []
+    fields: List[Optional[str]] = []
+    for literal, field, spec, conversion in Formatter().parse(template):
+        if spec or conversion:
+            raise ValueError(f"不支持带格式说明的字段: {field}")
+        literals.append(literal)
+        fields.append(field)
+    
+    def render(values: Mapping[str, str]) -> str:
+        parts = []
+        for literal, field in zip(literals, fields):
+            parts.append(literal)
+            if field is not None:
+                parts.append(str(values[field]))
+        return "".join(parts)
+    
+    return render
+
+
+render_analysis_prompt = compile_template(ANALYSIS_PROMPT_TEMPLATE)
+render_bug_context = compile_template(BUG_CONTEXT_TEMPLATE)
+render_batch_prompt = compile_template(BATCH_ANALYSIS_PROMPT_TEMPLATE)
 
-def format_stack_trace_section(parsed_stack: Optional[Dict]) -> str:
+
+# 扫描 JSON 结构时只需关注的字符
+_JSON_STRUCTURE_PATTERN = re.compile(r'[{}"\\]')
+
+
+def find_json_span(text: str, start: int = 0) -> Optional[Tuple[int, int]]:
+    """
+    从 start 开始查找第一个括号配对完整的 JSON 对象，返回 (起始, 结束) 下标
+    
+    单次线性扫描，跳过字符串字面量中的括号和转义字符，不会像贪婪正则那样回溯；
+    普通字符由正则直接跳过，只在括号、引号、反斜杠处进入 Python 逻辑。
+    """
+    begin = text.find("{", start)
+    if begin < 0:
+        return None
+    
+    depth = 0
+    in_string = False
+    skip_to = begin  # 转义序列中被转义的字符不参与判断
+    for match in _JSON_STRUCTURE_PATTERN.finditer(text, begin):
+        i = match.start()
+        if i < skip_to:
+            continue
+        ch = text[i]
+        if in_string:
+            if ch == "\\":
+                skip_to = i + 2
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return begin, i + 1
+    return None
+
+
+def extract_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """
+    从 LLM 输出中提取第一个可以解析的 JSON 对象
+    
+    说明文字中的 {placeholder} 之类片段解析失败时，从其结尾继续查找下一个候选，整体仍为线性扫描。
+    """
+    start = 0
+    while (span := find_json_span(text, start)) is not None:
+        try:
+            data = orjson.loads(text[span[0]:span[1]])
+        except orjson.JSONDecodeError:
+            data = None
+        if isinstance(data, dict):
+            return data
+        start = span[1]
+    return None
+
+
+# ============ Token 截断 ============
+
+# 各部分的 token 上限（按 cl100k_base 计算，gpt-4 / gpt-3.5 系列使用该编码）
+PAYLOAD_MAX_TOKENS = 128
+LOG_LINE_MAX_TOKENS = 128
+CASE_MAX_TOKENS = 200
+CODE_MAX_TOKENS = 256
+
+# 无法加载编码表时按 UTF-8 字节估算（约 3 字节一个 token，中文约一个汉字一个 token）
+FALLBACK_BYTES_PER_TOKEN = 3
+
+
+@lru_cache(maxsize=1)
+def get_token_encoder() -> Optional[tiktoken.Encoding]:
+    """加载 tokenizer（首次使用需要下载编码表，失败时返回 None）"""
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning("tiktoken 编码表加载失败，按字节截断: %s", type(e).__name__)
+        return None
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """将文本截断到最多 max_tokens 个 token"""
+    # 每个 token 至少一个字节、每个字符至多 4 字节：足够短的文本无需编码
+    if len(text) * 4 <= max_tokens:
+        return text
+    
+    encoder = get_token_encoder()
+    if encoder is None:
+        limit = max_tokens * FALLBACK_BYTES_PER_TOKEN
+        data = text.encode("utf-8")
+        return text if len(data) <= limit else data[:limit].decode("utf-8", "ignore")
+    
+    # 先按字符粗截，避免对超长文本整体编码
+    tokens = encoder.encode(text[:max_tokens * 16], disallowed_special=())
+    if len(tokens) <= max_tokens and len(text) <= max_tokens * 16:
+        return text
+    return encoder.decode(tokens[:max_tokens])
+
+
+def format_stack_trace_section(parsed_stack: Optional[ParsedStackTrace]) -> str:
     """格式化堆栈信息部分"""
     if not parsed_stack:
         return "**堆栈信息**: 无"
     
-    lines = ["**堆栈信息**:\n```"]
-    for frame in parsed_stack.get("frames", [])[:10]:  # 最多显示10帧
-        prefix = "[框架] " if frame.get("is_framework") else "[业务] "
-        lines.append(f"{prefix}{frame['file']}:{frame['line']} in {frame['function']}")
-        if frame.get("code"):
-            lines.append(f"    {frame['code']}")
-    lines.append("```")
+    # 每帧一行（有源码时附带缩进的源码行），最多显示10帧
+    frames = "".join(
+        f"{'[框架] ' if frame.is_framework else '[业务] '}{frame.file}:{frame.line} in {frame.function}\n"
+        + (f"    {frame.code}\n" if frame.code else "")
+        for frame in parsed_stack.frames[:10]
+    )
+    section = f"**堆栈信息**:\n```\n{frames}```"
     
-    if parsed_stack.get("root_frame"):
-        rf = parsed_stack["root_frame"]
-        lines.append(f"\n**关键位置**: {rf['file']}:{rf['line']} in {rf['function']}")
+    rf = parsed_stack.root_frame
+    if rf:
+        section += f"\n\n**关键位置**: {rf.file}:{rf.line} in {rf.function}"
     
-    return "\n".join(lines)
+    return section
 
 
 def format_context_section(context: Optional[Dict]) -> str:
@@ -133,9 +297,9 @@ def format_context_section(context: Optional[Dict]) -> str:
     if context.get("user_description"):
         parts.append(f"**用户描述**: {context['user_description']}")
     if context.get("request_payload"):
-        parts.append(f"**请求参数**: {json.dumps(context['request_payload'], ensure_ascii=False)[:500]}")
+        parts.append(f"**请求参数**: {truncate_tokens(json.dumps(context['request_payload'], ensure_ascii=False), PAYLOAD_MAX_TOKENS)}")
     if context.get("response_payload"):
-        parts.append(f"**响应内容**: {json.dumps(context['response_payload'], ensure_ascii=False)[:500]}")
+        parts.append(f"**响应内容**: {truncate_tokens(json.dumps(context['response_payload'], ensure_ascii=False), PAYLOAD_MAX_TOKENS)}")
     
     return "\n".join(parts) if parts else ""
 
@@ -145,11 +309,9 @@ def format_logs_section(logs: List[str]) -> str:
     if not logs:
         return "**相关日志**: 无"
     
-    lines = ["**相关日志**:\n```"]
-    for log in logs[:20]:  # 最多20条
-        lines.append(log[:500])  # 每条最多500字符
-    lines.append("```")
-    return "\n".join(lines)
+    # 最多20条，每条按 token 上限截断
+    body = "".join(f"{truncate_tokens(log, LOG_LINE_MAX_TOKENS)}\n" for log in logs[:20])
+    return f"**相关日志**:\n```\n{body}```"
 
 
 def format_similar_cases_section(cases: List[RetrievalResult]) -> str:
@@ -157,13 +319,11 @@ def format_similar_cases_section(cases: List[RetrievalResult]) -> str:
     if not cases:
         return "无相似历史案例"
     
-    lines = []
-    for i, case in enumerate(cases[:3], 1):  # 最多3个
-        lines.append(f"**案例 {i}** (相似度: {case.score:.2f})")
-        lines.append(case.content[:800])
-        lines.append("")
-    
-    return "\n".join(lines)
+    # 最多3个，案例之间空一行
+    return "\n".join(
+        f"**案例 {i}** (相似度: {case.score:.2f})\n{truncate_tokens(case.content, CASE_MAX_TOKENS)}\n"
+        for i, case in enumerate(cases[:3], 1)
+    )
 
 
 def format_code_section(code_results: List[RetrievalResult]) -> str:
@@ -171,29 +331,125 @@ def format_code_section(code_results: List[RetrievalResult]) -> str:
     if not code_results:
         return "无相关代码"
     
-    lines = []
-    for i, code in enumerate(code_results[:5], 1):  # 最多5个
-        metadata = code.metadata or {}
-        file_path = metadata.get("file_path", "unknown")
-        lines.append(f"**代码片段 {i}** - `{file_path}` (相似度: {code.score:.2f})")
-        lines.append("```")
-        lines.append(code.content[:1000])
-        lines.append("```")
-        lines.append("")
+    # 最多5个，片段之间空一行
+    return "\n".join(
+        f"**代码片段 {i}** - `{(code.metadata or {}).get('file_path', 'unknown')}` (相似度: {code.score:.2f})\n"
+        f"```\n{truncate_tokens(code.content, CODE_MAX_TOKENS)}\n```\n"
+        for i, code in enumerate(code_results[:5], 1)
+    )
+
+
+# ============ 枚举解析表 ============
+# 同时收录大写和小写形式，常见输出直接命中，无需逐次转换大小写
+
+CATEGORY_MAP: Dict[str, BugCategory] = {
+    **{c.value: c for c in BugCategory},
+    **{c.value.lower(): c for c in BugCategory}
+}
+
+FIX_TYPE_MAP: Dict[str, FixType] = {
+    **{t.value: t for t in FixType},
+    **{t.value.upper(): t for t in FixType}
+}
+
+SEVERITY_MAP: Dict[str, BugSeverity] = {
+    **{s.value: s for s in BugSeverity},
+    **{s.value.lower(): s for s in BugSeverity}
+}
+
+
+# ============ LLM 响应结构 ============
+# 由 pydantic-core 一次完成 JSON 解码和校验；LLM 输出的字段缺失、为 null 或类型不符时取默认值，不使整个响应作废
+
+def _none_on_error(value: Any, handler: ValidatorFunctionWrapHandler) -> Any:
+    """字段校验失败时取 None"""
+    try:
+        return handler(value)
+    except ValidationError:
+        return None
+
+
+T = TypeVar("T")
+Lenient = Annotated[Optional[T], WrapValidator(_none_on_error)]
+
+
+class _LLMRootCause(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
+    description: Lenient[str] = None
+    category: Lenient[str] = None
+    confidence: Lenient[float] = None
+
+
+class _LLMLocation(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
+    file: Lenient[str] = None
+    line_start: Lenient[int] = None
+    line_end: Lenient[int] = None
+    function: Lenient[str] = None
+
+
+class _LLMFixSuggestion(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
+    fix_type: Lenient[str] = None
+    description: Lenient[str] = None
+    code_diff: Lenient[str] = None
+    test_verification: Lenient[str] = None
+
+
+class _LLMImpactAssessment(BaseModel):
+    model_config = ConfigDict(frozen=True)
     
-    return "\n".join(lines)
+    affected_users: Lenient[str] = None
+    affected_features: Lenient[List[str]] = None
+    urgency: Lenient[str] = None
+
+
+class LLMAnalysisResponse(BaseModel):
+    """LLM 返回的分析 JSON"""
+    summary: Lenient[str] = None
+    root_cause: Lenient[_LLMRootCause] = None
+    location: Lenient[_LLMLocation] = None
+    fix_suggestion: Lenient[_LLMFixSuggestion] = None
+    impact_assessment: Lenient[_LLMImpactAssessment] = None
+    additional_investigation: Lenient[List[str]] = None
+
+
+# 响应中缺少对应部分时使用的共享空对象（模型不可变，可以安全共享）
+_EMPTY_ROOT_CAUSE = _LLMRootCause()
+_EMPTY_FIX_SUGGESTION = _LLMFixSuggestion()
+_EMPTY_IMPACT_ASSESSMENT = _LLMImpactAssessment()
+
+# 相似案例列表的校验器（模块级构建，避免每次调用重新生成校验逻辑）
+_SIMILAR_CASES_ADAPTER = TypeAdapter(List[SimilarCase])
+
+
+def retrieval_counts(retrieval_results: Dict[str, List[RetrievalResult]]) -> Dict[str, int]:
+    """各路检索结果数量（记录在分析结果的 retrieval_context 中）"""
+    return {
+        f"{source}_count": len(retrieval_results.get(source) or ())
+        for source in ("code", "case", "log_pattern")
+    }
 
 
 class LLMAnalyzer:
     """LLM 分析器"""
     
+    # (base_url, model) -> 是否支持 response_format=json_object；同一服务只探测一次
+    _json_mode_support: Dict[Tuple[str, str], bool] = {}
+    
     def __init__(
         self,
         api_key: str,
         model: str = "gpt-4-turbo-preview",
         base_url: Optional[str] = None,
         temperature: float = 0.2,
-        verify_ssl: bool = False
+        verify_ssl: bool = False,
+        batch_size: int = 8,
+        batch_wait_ms: int = 50,
+        pattern_fast_path_threshold: float = 0.9
     ):
         """
         初始化 LLM 分析器
@@ -204,17 +460,35 @@ class LLMAnalyzer:
             base_url: API 基础 URL（用于代理）
             temperature: 生成温度
             verify_ssl: 是否验证 SSL 证书
+            batch_size: 并发请求合并为一次 LLM 调用的最大 Bug 数（1 表示不合并）
+            batch_wait_ms: 合并请求时的最长等待时间（毫秒）
+            pattern_fast_path_threshold: 日志模式匹配分数达到该值且堆栈中没有业务代码时，直接按模式给出结果（大于 1 表示禁用）
         """
-        # 创建自定义 HTTP 客户端（处理 SSL 问题）
-        http_client = httpx.AsyncClient(verify=verify_ssl)
-        
-        self.client = AsyncOpenAI(
-            api_key=api_key,
-            base_url=base_url,
-            http_client=http_client
-        )
+        # 相同配置的分析器共用同一个客户端（HTTP/2 长连接池）
+        self.client = get_openai_client(api_key, base_url, verify_ssl)
+        self._json_mode_key = (str(self.client.base_url), model)
         self.model = model
         self.temperature = temperature
+        self.pattern_fast_path_threshold = pattern_fast_path_threshold
+        
+        # 并发到达的分析请求合并为一次 LLM 调用，共用系统提示词和输出格式说明
+        self._batcher: Optional[MicroBatcher[Dict[str, str], str]] = None
+        if batch_size > 1:
+            self._batcher = MicroBatcher(
+                self._complete_batch,
+                max_batch=batch_size,
+                max_wait_ms=batch_wait_ms
+            )
+    
+    async def warmup(self):
+        """预先建立到 LLM 服务的连接（TLS 握手）并加载 tokenizer，首个分析请求无需再等待"""
+        await asyncio.to_thread(get_token_encoder)
+        try:
+            await self.client.with_options(max_retries=0, timeout=5.0).models.list()
+            logger.debug("LLM 连接预热完成")
+        except Exception as e:
+            # 部分代理不支持 /models 接口，预热失败不影响正常使用
+            logger.warning("LLM 连接预热失败: %s: %s", type(e).__name__, e)
     
     async def analyze(
         self,
@@ -233,12 +507,17 @@ class LLMAnalyzer:
         Returns:
             分析结果
         """
+        # 已知日志模式高度匹配时直接给出结果，不调用 LLM
+        result = self._try_pattern_fast_path(bug_info, preprocessed, retrieval_results)
+        if result is not None:
+            return result
+        
         # 构建 Prompt
-        error_info = bug_info.get("error_info", {})
-        parsed_stack = preprocessed.get("parsed_stack", {})
+        error_info = bug_info.get("error_info") or {}
+        parsed_stack: Optional[ParsedStackTrace] = preprocessed.get("parsed_stack")
         
-        prompt = ANALYSIS_PROMPT_TEMPLATE.format(
-            exception_type=parsed_stack.get("exception_type", "Unknown") if parsed_stack else "Unknown",
+        fields = dict(
+            exception_type=parsed_stack.exception_type if parsed_stack else "Unknown",
             error_message=error_info.get("error_message", "No error message"),
             severity=bug_info.get("severity", "P2"),
             timestamp=bug_info.get("timestamp", datetime.now().isoformat()),
@@ -253,164 +532,265 @@ class LLMAnalyzer:
             )
         )
         
+        # 相似案例只依赖检索结果，在等待 LLM 之前构建
+        similar_cases = self._build_similar_cases(retrieval_results)
+        
         # 调用 LLM
-        try:
-            print(f"[DEBUG] 开始调用 LLM: {self.model}")
-            # 智谱 AI 可能不支持 response_format，需要兼容处理
-            try:
-                response = await self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": SYSTEM_PROMPT},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=self.temperature,
-                    response_format={"type": "json_object"},
-                    timeout=60.0  # 60秒超时
-                )
-                print(f"[DEBUG] LLM 调用成功 (with response_format)")
-            except Exception as e1:
-                print(f"[DEBUG] 使用 response_format 失败: {e1}, 尝试降级...")
-                # 降级：不使用 response_format
-                response = await self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": SYSTEM_PROMPT},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=self.temperature,
-                    timeout=60.0  # 60秒超时
-                )
-                print(f"[DEBUG] LLM 调用成功 (without response_format)")
-        except Exception as e:
-            print(f"[DEBUG] LLM 调用失败: {type(e).__name__}: {str(e)}")
-            raise ConnectionError(f"LLM API 调用失败: {str(e)}")
+        if self._batcher is not None:
+            response_text = await self._batcher.submit(fields)
+        else:
+            response_text = await self._complete(render_analysis_prompt(fields))
         
         # 解析响应
-        response_text = response.choices[0].message.content
-        result = self._parse_response(response_text, bug_info, retrieval_results)
+        result = self._parse_response(response_text, bug_info, retrieval_results, similar_cases)
         
         return result
     
+    async def _complete_batch(self, batch: List[Dict[str, str]]) -> List[Union[str, BaseException]]:
+        """
+        一次 LLM 调用分析一批 Bug，返回与输入顺序一致的单个 Bug 响应文本
+        
+        结果按 bug_index（缺失时按数组位置）分发；批量调用失败（如合并后超出上下文长度）时全部单独重新调用，
+        批量响应中缺失或无法解析的 Bug 也单独重新调用。单独调用仍失败的 Bug 在对应位置返回异常，不影响同批其他 Bug。
+        """
+        if len(batch) == 1:
+            return [await self._complete(render_analysis_prompt(batch[0]))]
+        
+        bug_sections = "\n\n".join(
+            f"## Bug {i}\n\n" + render_bug_context(fields)
+            for i, fields in enumerate(batch, 1)
+        )
+        prompt = render_batch_prompt({"count": len(batch), "bug_sections": bug_sections})
+        logger.debug("合并 %d 个 Bug 为一次 LLM 调用", len(batch))
+        
+        try:
+            response_text = await self._complete(prompt, timeout=60.0 * len(batch))
+        except ConnectionError as e:
+            logger.warning("批量 LLM 调用失败，逐个重新分析: %s", e)
+            response_text = ""
+        # 不支持 response_format 的接口常把 JSON 包在代码块或说明文字中，与单个 Bug 一样提取第一个 JSON 对象
+        results = (extract_json_object(response_text) or {}).get("results")
+        
+        texts: List[Optional[Union[str, BaseException]]] = [None] * len(batch)
+        if isinstance(results, list):
+            for position, item in enumerate(results):
+                if not isinstance(item, dict):
+                    continue
+                index = item.get("bug_index", position + 1)
+                if isinstance(index, int) and 1 <= index <= len(batch) and texts[index - 1] is None:
+                    texts[index - 1] = orjson.dumps(item).decode()
+        
+        missing = [i for i, text in enumerate(texts) if text is None]
+        if missing:
+            logger.debug("批量响应缺少 %d 个 Bug 的结果，逐个重新分析", len(missing))
+            retried = await asyncio.gather(*(
+                self._complete(render_analysis_prompt(batch[i]))
+                for i in missing
+            ), return_exceptions=True)
+            for i, text in zip(missing, retried):
+                texts[i] = text
+        return texts
+    
+    async def _complete(self, prompt: str, timeout: float = 60.0) -> str:
+        """调用 LLM 并返回响应文本（流式接收，边生成边读取）"""
+        messages = [SYSTEM_MESSAGE, {"role": "user", "content": prompt}]
+        try:
+            logger.debug("开始调用 LLM: %s", self.model)
+            # 智谱 AI 可能不支持 response_format：首次请求探测，结果按 (base_url, model) 缓存
+            response = None
+            json_mode_error = None
+            if self._json_mode_support.get(self._json_mode_key, True):
+                try:
+                    response = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=self.temperature,
+                        response_format={"type": "json_object"},
+                        stream=True,
+                        timeout=timeout
+                    )
+                    self._json_mode_support[self._json_mode_key] = True
+                    logger.debug("LLM 调用成功 (with response_format)")
+                except (BadRequestError, UnprocessableEntityError) as e1:
+                    # 仅请求被拒绝时不带 response_format 重试；网络错误、限流等直接向上抛出
+                    json_mode_error = e1
+            
+            if response is None:
+                try:
+                    response = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=self.temperature,
+                        stream=True,
+                        timeout=timeout
+                    )
+                except Exception:
+                    # 超长、内容审核等 400 与 response_format 无关，只有错误信息点名该参数时才记为不支持
+                    if json_mode_error is not None and "response_format" in str(json_mode_error):
+                        self._mark_json_mode_unsupported(json_mode_error)
+                    raise
+                # 去掉 response_format 后成功，说明接口不支持该参数
+                if json_mode_error is not None:
+                    self._mark_json_mode_unsupported(json_mode_error)
+                logger.debug("LLM 调用成功 (without response_format)")
+            
+            parts = []
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+        except Exception as e:
+            logger.warning("LLM 调用失败: %s: %s", type(e).__name__, e)
+            raise ConnectionError(f"LLM API 调用失败: {str(e)}")
+        
+        return "".join(parts)
+    
+    def _mark_json_mode_unsupported(self, error: Exception):
+        """记录当前 (base_url, model) 不支持 response_format，后续请求不再携带"""
+        logger.warning("使用 response_format 失败: %s, 后续请求不再使用", error)
+        self._json_mode_support[self._json_mode_key] = False
+    
     def _parse_response(
         self,
         response_text: str,
         bug_info: Dict[str, Any],
-        retrieval_results: Dict[str, List[RetrievalResult]]
+        retrieval_results: Dict[str, List[RetrievalResult]],
+        similar_cases: Optional[List[SimilarCase]] = None
     ) -> AnalysisResult:
         """解析 LLM 响应"""
         try:
-            # 尝试直接解析 JSON
-            data = json.loads(response_text)
-        except json.JSONDecodeError:
-            # 尝试提取 JSON 块
-            json_match = re.search(r'\{[\s\S]*\}', response_text)
-            if json_match:
-                data = json.loads(json_match.group())
-            else:
+            # 直接解码并校验
+            data = LLMAnalysisResponse.model_validate_json(response_text)
+        except ValidationError:
+            # 尝试提取 JSON 块（如被 markdown 代码块或说明文字包裹）
+            obj = extract_json_object(response_text)
+            if obj is None:
                 # 返回默认结果
                 return self._create_fallback_result(bug_info, response_text)
+            data = LLMAnalysisResponse.model_validate(obj)
         
         # 构建结果
+        rc = data.root_cause or _EMPTY_ROOT_CAUSE
         root_cause = RootCause(
-            description=data.get("root_cause", {}).get("description", "Unable to determine"),
-            category=self._parse_category(data.get("root_cause", {}).get("category")),
-            confidence=data.get("root_cause", {}).get("confidence", 0.5)
+            description=rc.description if rc.description is not None else "Unable to determine",
+            category=self._parse_category(rc.category),
+            confidence=min(max(rc.confidence, 0.0), 1.0) if rc.confidence is not None else 0.5
         )
         
         location = None
-        if data.get("location") and data["location"].get("file"):
-            line_start = data["location"].get("line_start")
-            # 如果 line_start 是 None，尝试设为 None（现在模型支持了）
+        loc = data.location
+        if loc is not None and loc.file:
             location = CodeLocation(
-                file=data["location"]["file"],
-                line_start=line_start if isinstance(line_start, int) else None,
-                line_end=data["location"].get("line_end"),
-                function=data["location"].get("function")
+                file=loc.file,
+                line_start=loc.line_start,
+                line_end=loc.line_end,
+                function=loc.function
             )
         
+        fix = data.fix_suggestion or _EMPTY_FIX_SUGGESTION
         fix_suggestion = FixSuggestion(
-            fix_type=self._parse_fix_type(data.get("fix_suggestion", {}).get("fix_type")),
-            description=data.get("fix_suggestion", {}).get("description", ""),
-            code_diff=data.get("fix_suggestion", {}).get("code_diff"),
-            test_verification=data.get("fix_suggestion", {}).get("test_verification")
+            fix_type=self._parse_fix_type(fix.fix_type),
+            description=fix.description or "",
+            code_diff=fix.code_diff,
+            test_verification=fix.test_verification
         )
         
-        impact = data.get("impact_assessment", {})
+        impact = data.impact_assessment or _EMPTY_IMPACT_ASSESSMENT
         impact_assessment = ImpactAssessment(
-            affected_users=impact.get("affected_users"),
-            affected_features=impact.get("affected_features", []),
-            urgency=self._parse_severity(impact.get("urgency"))
+            affected_users=impact.affected_users,
+            affected_features=impact.affected_features or [],
+            urgency=self._parse_severity(impact.urgency)
         )
         
-        # 转换相似案例
-        similar_cases = []
-        for case in retrieval_results.get("case", [])[:3]:
-            similar_cases.append(SimilarCase(
-                case_id=case.id,
-                title=case.metadata.get("title", "Unknown"),
-                similarity=case.score,
-                resolution=case.metadata.get("resolution")
-            ))
+        if similar_cases is None:
+            similar_cases = self._build_similar_cases(retrieval_results)
         
         return AnalysisResult(
-            analysis_id=str(uuid.uuid4()),
+            analysis_id=secrets.token_hex(16),
             bug_id=bug_info.get("bug_id"),
-            summary=data.get("summary", "Analysis completed"),
+            summary=data.summary if data.summary is not None else "Analysis completed",
             root_cause=root_cause,
             location=location,
             fix_suggestion=fix_suggestion,
             impact_assessment=impact_assessment,
             similar_cases=similar_cases,
-            additional_investigation=data.get("additional_investigation", []),
-            retrieval_context={
-                "code_count": len(retrieval_results.get("code", [])),
-                "case_count": len(retrieval_results.get("case", [])),
-                "log_pattern_count": len(retrieval_results.get("log_pattern", []))
-            }
+            additional_investigation=data.additional_investigation or [],
+            retrieval_context=retrieval_counts(retrieval_results)
+        )
+    
+    def _try_pattern_fast_path(
+        self,
+        bug_info: Dict[str, Any],
+        preprocessed: Dict[str, Any],
+        retrieval_results: Dict[str, List[RetrievalResult]]
+    ) -> Optional[AnalysisResult]:
+        """
+        规则快速路径：最相似的日志模式分数达到阈值，且堆栈中没有需要定位的业务代码时，
+        直接用模式中预置的分类、严重程度和解决方案构建结果
+        """
+        patterns = retrieval_results.get("log_pattern") or []
+        if not patterns or preprocessed.get("business_frames"):
+            return None
+        
+        top = max(patterns, key=lambda p: p.score)
+        if top.score < self.pattern_fast_path_threshold:
+            return None
+        
+        logger.debug("命中日志模式快速路径: %s (%.3f)", top.id, top.score)
+        meta = top.metadata
+        description = meta.get("description") or top.id
+        return AnalysisResult(
+            analysis_id=secrets.token_hex(16),
+            bug_id=bug_info.get("bug_id"),
+            summary=description,
+            root_cause=RootCause(
+                description=f"{description}（匹配已知日志模式 {top.id}）",
+                category=self._parse_category(meta.get("category")),
+                confidence=min(top.score, 1.0)
+            ),
+            fix_suggestion=FixSuggestion(
+                fix_type=FixType.ESCALATE,
+                description=meta.get("solution", "")
+            ),
+            impact_assessment=ImpactAssessment(
+                urgency=self._parse_severity(meta.get("severity"))
+            ),
+            similar_cases=self._build_similar_cases(retrieval_results),
+            retrieval_context={**retrieval_counts(retrieval_results), "fast_path_pattern": top.id}
         )
     
+    @staticmethod
+    def _build_similar_cases(retrieval_results: Dict[str, List[RetrievalResult]]) -> List[SimilarCase]:
+        """转换相似案例（整个列表一次校验）"""
+        return _SIMILAR_CASES_ADAPTER.validate_python([
+            {
+                "case_id": case.id,
+                "title": case.metadata.get("title", "Unknown"),
+                "similarity": case.score,
+                "resolution": case.metadata.get("resolution")
+            }
+            for case in retrieval_results.get("case", [])[:3]
+        ])
+    
     def _parse_category(self, category_str: Optional[str]) -> BugCategory:
         """解析 Bug 分类"""
-        if not category_str:
+        if not isinstance(category_str, str):
             return BugCategory.UNKNOWN
-        
-        category_map = {
-            "API_ERROR": BugCategory.API_ERROR,
-            "DATA_ERROR": BugCategory.DATA_ERROR,
-            "DEPENDENCY_ERROR": BugCategory.DEPENDENCY_ERROR,
-            "LOGIC_ERROR": BugCategory.LOGIC_ERROR,
-            "CONFIG_ERROR": BugCategory.CONFIG_ERROR,
-            "PERFORMANCE": BugCategory.PERFORMANCE,
-        }
-        return category_map.get(category_str.upper(), BugCategory.UNKNOWN)
+        category = CATEGORY_MAP.get(category_str)
+        return category or CATEGORY_MAP.get(category_str.upper(), BugCategory.UNKNOWN)
     
     def _parse_fix_type(self, fix_type_str: Optional[str]) -> FixType:
         """解析修复类型"""
-        if not fix_type_str:
+        if not isinstance(fix_type_str, str):
             return FixType.ESCALATE
-        
-        type_map = {
-            "code_change": FixType.CODE_CHANGE,
-            "config_change": FixType.CONFIG_CHANGE,
-            "rollback": FixType.ROLLBACK,
-            "escalate": FixType.ESCALATE,
-            "no_action": FixType.NO_ACTION,
-        }
-        return type_map.get(fix_type_str.lower(), FixType.ESCALATE)
+        fix_type = FIX_TYPE_MAP.get(fix_type_str)
+        return fix_type or FIX_TYPE_MAP.get(fix_type_str.lower(), FixType.ESCALATE)
     
     def _parse_severity(self, severity_str: Optional[str]) -> BugSeverity:
         """解析严重程度"""
-        if not severity_str:
+        if not isinstance(severity_str, str):
             return BugSeverity.P2
-        
-        severity_map = {
-            "P0": BugSeverity.P0,
-            "P1": BugSeverity.P1,
-            "P2": BugSeverity.P2,
-            "P3": BugSeverity.P3,
-        }
-        return severity_map.get(severity_str.upper(), BugSeverity.P2)
+        severity = SEVERITY_MAP.get(severity_str)
+        return severity or SEVERITY_MAP.get(severity_str.upper(), BugSeverity.P2)
     
     def _create_fallback_result(
         self,
@@ -419,7 +799,7 @@ class LLMAnalyzer:
     ) -> AnalysisResult:
         """创建降级结果"""
         return AnalysisResult(
-            analysis_id=str(uuid.uuid4()),
+            analysis_id=secrets.token_hex(16),
             bug_id=bug_info.get("bug_id"),
             summary="Analysis completed but response parsing failed",
             root_cause=RootCause(
@@ -0,0 +1,107 @@
+"""
+微批处理 - 将短时间内并发到达的请求合并为一批统一处理
+"""
+import asyncio
+from typing import List, Callable, Awaitable, Generic, TypeVar, Optional, Tuple, Set, Union
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    微批处理器
+
+    请求放入队列后由单个消费者任务收集：凑满 max_batch 条或等待 max_wait_ms 后，
+    调用 process_batch 一次性处理整批，并按顺序把结果分发给各请求。
+    process_batch 整体抛出异常时整批失败；结果列表中的异常实例只让对应的请求失败。
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[T]], Awaitable[List[Union[R, BaseException]]]],
+        max_batch: int = 8,
+        max_wait_ms: int = 50
+    ):
+        """
+        Args:
+            process_batch: 批处理函数，返回与输入等长、顺序一致的结果列表（单条失败时该位置为异常实例）
+            max_batch: 每批最大条数
+            max_wait_ms: 收到第一条请求后最长等待时间（毫秒）
+        """
+        self.process_batch = process_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumer: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._running: Set[asyncio.Task] = set()  # 持有执行中的批任务引用，防止被回收
+
+    async def submit(self, item: T) -> R:
+        """提交一条请求并等待其结果"""
+        self._ensure_consumer()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    def _ensure_consumer(self):
+        """在当前事件循环中启动消费者任务（事件循环更换后重新创建）"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._consumer is not None and not self._consumer.done():
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._consumer = loop.create_task(self._consume())
+
+    async def _consume(self):
+        """消费者：收集一批请求并统一处理"""
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # 批处理在独立任务中执行，不阻塞下一批的收集
+            task = self._loop.create_task(self._run_batch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run_batch(self, batch: List[Tuple[T, asyncio.Future]]):
+        """执行一批请求并分发结果"""
+        items = [item for item, _ in batch]
+        try:
+            results = await self.process_batch(items)
+            if len(results) != len(items):
+                raise ValueError(f"批处理结果数量不匹配: {len(results)} != {len(items)}")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def close(self):
+        """停止消费者任务"""
+        if self._consumer is not None:
+            self._consumer.cancel()
+            try:
+                await self._consumer
+            except asyncio.CancelledError:
+                pass
+            self._consumer = None
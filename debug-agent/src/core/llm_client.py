@@ -0,0 +1,61 @@
+"""
+LLM 客户端 - 进程内共享的 AsyncOpenAI 实例
+"""
+import ssl
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+
+
+# (api_key, base_url, verify_ssl) -> 客户端；相同配置共用一个连接池
+_CLIENT_CACHE: Dict[Tuple[str, Optional[str], bool], AsyncOpenAI] = {}
+
+
+@lru_cache(maxsize=2)
+def get_ssl_context(verify_ssl: bool) -> ssl.SSLContext:
+    """
+    获取共享的 SSLContext（按是否验证证书各一个）
+
+    所有客户端共用同一个上下文，只加载一次系统 CA 证书，TLS 会话票据也可以在连接之间复用。
+    verify_ssl=False 时不校验证书和主机名，连接可被中间人劫持，只应在公司代理等受控网络中使用。
+    """
+    context = ssl.create_default_context()
+    if not verify_ssl:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+def get_openai_client(
+    api_key: str,
+    base_url: Optional[str] = None,
+    verify_ssl: bool = False
+) -> AsyncOpenAI:
+    """
+    获取（首次调用时创建）共享的 AsyncOpenAI 客户端
+
+    底层 httpx 客户端使用 HTTP/2 长连接，同一进程内的多个分析器、多次调用复用已建立的 TLS 连接。
+
+    Args:
+        api_key: OpenAI API Key
+        base_url: API 基础 URL（用于代理）
+        verify_ssl: 是否验证 SSL 证书
+    """
+    key = (api_key, base_url, verify_ssl)
+    client = _CLIENT_CACHE.get(key)
+    if client is None:
+        # 注意：传入自定义 transport 时 SSL 配置必须设置在 transport 上
+        transport = httpx.AsyncHTTPTransport(
+            http2=True,
+            verify=get_ssl_context(verify_ssl),
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64, keepalive_expiry=60)
+        )
+        client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=httpx.AsyncClient(transport=transport, timeout=60.0)
+        )
+        _CLIENT_CACHE[key] = client
+    return client
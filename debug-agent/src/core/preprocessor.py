@@ -2,11 +2,17 @@
 预处理模块 - 解析堆栈、提取实体、聚合日志
 """
 import re
+from functools import lru_cache
+from operator import itemgetter
 from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass
 
 
-@dataclass
+# 堆栈解析结果缓存条数（重复告警的堆栈通常完全相同）
+STACK_PARSE_CACHE_SIZE = 1024
+
+
+@dataclass(slots=True)
 class StackFrame:
     """堆栈帧"""
     file: str
@@ -16,7 +22,7 @@ class StackFrame:
     is_framework: bool = False
 
 
-@dataclass
+@dataclass(slots=True)
 class ParsedStackTrace:
     """解析后的堆栈信息"""
     exception_type: str
@@ -28,9 +34,9 @@ class ParsedStackTrace:
 class StackParser:
     """堆栈解析器"""
     
-    # Python 堆栈正则
+    # Python 堆栈正则：帧所在行，以及紧随其后的源码行（下一行不是另一个帧时）
     PYTHON_FRAME_PATTERN = re.compile(
-        r'File "([^"]+)", line (\d+), in (\w+)'
+        r'File "([^"\n]+)", line (\d+), in (\w+)[^\n]*(?:\n(?![^\S\n]*File)([^\n]*))?'
     )
     PYTHON_EXCEPTION_PATTERN = re.compile(
         r'^(\w+(?:\.\w+)*(?:Error|Exception|Warning)?): (.+)$',
@@ -46,22 +52,25 @@ class StackParser:
         re.MULTILINE
     )
     
-    # 常见框架包名（用于识别框架层 vs 业务层）
-    FRAMEWORK_PATTERNS = [
-        r'site-packages',
-        r'dist-packages',
-        r'lib/python',
-        r'java\.lang\.',
-        r'java\.util\.',
-        r'org\.springframework\.',
-        r'com\.sun\.',
-        r'sun\.',
-        r'fastapi',
-        r'starlette',
-        r'uvicorn',
-        r'asyncio',
-        r'concurrent',
-    ]
+    # 未能提取异常信息时使用的占位类型
+    UNPARSED_EXCEPTION_TYPES = ("Unknown", "UnknownError", "UnknownException")
+    
+    # 常见框架包名（用于识别框架层 vs 业务层）；均为小写的普通子串，与小写后的路径直接做子串查找，不经过正则
+    FRAMEWORK_LITERALS = (
+        'site-packages',
+        'dist-packages',
+        'lib/python',
+        'java.lang.',
+        'java.util.',
+        'org.springframework.',
+        'com.sun.',
+        'sun.',
+        'fastapi',
+        'starlette',
+        'uvicorn',
+        'asyncio',
+        'concurrent',
+    )
     
     def __init__(self, business_package: str = "copilot"):
         """
@@ -69,9 +78,18 @@ class StackParser:
             business_package: 业务代码包名，用于识别业务层堆栈
         """
         self.business_package = business_package
+        self._parse_cached = lru_cache(maxsize=STACK_PARSE_CACHE_SIZE)(self._parse)
     
     def parse(self, stack_trace: str) -> ParsedStackTrace:
-        """解析堆栈信息"""
+        """
+        解析堆栈信息
+        
+        相同的堆栈直接返回缓存的解析结果，调用方不应修改返回的对象。
+        """
+        return self._parse_cached(stack_trace)
+    
+    def _parse(self, stack_trace: str) -> ParsedStackTrace:
+        """解析堆栈信息（不使用缓存）"""
         if not stack_trace:
             return ParsedStackTrace(
                 exception_type="Unknown",
@@ -79,26 +97,30 @@ class StackParser:
                 frames=[]
             )
         
-        # 尝试 Python 格式
-        frames = self._parse_python_frames(stack_trace)
-        exception_type, exception_message = self._parse_python_exception(stack_trace)
+        # 先用子串判断可能的格式，只运行可能匹配的正则（两种帧正则分别以这两个字面量为必要条件）
+        maybe_python = 'File "' in stack_trace
+        maybe_java = '.java:' in stack_trace
         
-        # 如果 Python 解析失败，尝试 Java 格式
-        if not frames:
+        # 优先 Python 格式，解析不出帧时再尝试 Java 格式
+        frames = self._parse_python_frames(stack_trace) if maybe_python else []
+        if not frames and maybe_java:
             frames = self._parse_java_frames(stack_trace)
             if frames:
                 exception_type, exception_message = self._parse_java_exception(stack_trace)
+            else:
+                exception_type, exception_message = self._parse_python_exception(stack_trace)
+        else:
+            exception_type, exception_message = self._parse_python_exception(stack_trace)
         
-        # 标记框架层
-        for frame in frames:
-            frame.is_framework = self._is_framework_code(frame.file)
-        
-        # 找到业务代码中最底层的帧
+        # 标记框架层，同时记录业务代码中最底层（最后出现）的帧
+        # 框架判断内联在循环中：路径转小写后与小写字面量做子串查找，不逐帧调用方法
+        literals = self.FRAMEWORK_LITERALS
         root_frame = None
-        for frame in reversed(frames):
+        for frame in frames:
+            path = frame.file.lower()
+            frame.is_framework = any(literal in path for literal in literals)
             if not frame.is_framework:
                 root_frame = frame
-                break
         
         return ParsedStackTrace(
             exception_type=exception_type,
@@ -108,26 +130,16 @@ class StackParser:
         )
     
     def _parse_python_frames(self, stack_trace: str) -> List[StackFrame]:
-        """解析 Python 堆栈帧"""
+        """解析 Python 堆栈帧（对整个堆栈做一次 finditer，不按行切分）"""
         frames = []
-        lines = stack_trace.split('\n')
-        
-        for i, line in enumerate(lines):
-            match = self.PYTHON_FRAME_PATTERN.search(line)
-            if match:
-                code = None
-                if i + 1 < len(lines):
-                    next_line = lines[i + 1].strip()
-                    if next_line and not next_line.startswith('File'):
-                        code = next_line
-                
-                frames.append(StackFrame(
-                    file=match.group(1),
-                    line=int(match.group(2)),
-                    function=match.group(3),
-                    code=code
-                ))
-        
+        for match in self.PYTHON_FRAME_PATTERN.finditer(stack_trace):
+            code = match.group(4)
+            frames.append(StackFrame(
+                file=match.group(1),
+                line=int(match.group(2)),
+                function=match.group(3),
+                code=code.strip() or None if code else None
+            ))
         return frames
     
     def _parse_java_frames(self, stack_trace: str) -> List[StackFrame]:
@@ -155,12 +167,13 @@ class StackParser:
             return match.group(1), match.group(2)
         return "UnknownException", "Unable to parse exception"
     
-    def _is_framework_code(self, file_path: str) -> bool:
-        """判断是否是框架代码"""
-        for pattern in self.FRAMEWORK_PATTERNS:
-            if re.search(pattern, file_path, re.IGNORECASE):
-                return True
-        return False
+    def is_fully_parsed(self, parsed: Optional[ParsedStackTrace]) -> bool:
+        """是否同时解析出了堆栈帧和异常信息"""
+        return (
+            parsed is not None
+            and bool(parsed.frames)
+            and parsed.exception_type not in self.UNPARSED_EXCEPTION_TYPES
+        )
     
     def get_business_frames(self, parsed: ParsedStackTrace) -> List[StackFrame]:
         """获取业务代码相关的堆栈帧"""
@@ -210,28 +223,25 @@ class EntityExtractor:
         ],
     }
     
-    def extract(self, text: str) -> Dict[str, List[str]]:
-        """从文本中提取所有实体"""
-        entities = {}
-        
-        for entity_type, patterns in self.PATTERNS.items():
-            matches = []
-            for pattern in patterns:
-                for match in re.finditer(pattern, text, re.IGNORECASE):
-                    value = match.group(1)
-                    if value not in matches:
-                        matches.append(value)
-            if matches:
-                entities[entity_type] = matches
-        
-        return entities
+    # 全部模式合并为一个带命名组的正则，文本只扫描一次；组名为 "<实体类型>__<序号>"
+    COMBINED_PATTERN = re.compile(
+        '|'.join(
+            f'(?P<{entity_type}__{i}>{pattern})'
+            for entity_type, patterns in PATTERNS.items()
+            for i, pattern in enumerate(patterns)
+        ),
+        re.IGNORECASE
+    )
+    # 命名组 -> (实体类型, 实体值所在的组号)；实体值是各模式内的第一个分组
+    GROUP_TARGETS = {
+        name: (name.split('__', 1)[0], index + 1)
+        for name, index in COMBINED_PATTERN.groupindex.items()
+    }
     
-    def extract_error_keywords(self, text: str) -> List[str]:
-        """提取错误关键词"""
-        keywords = []
-        
-        # 常见错误关键词
-        error_patterns = [
+    # 常见错误关键词
+    ERROR_KEYWORD_PATTERNS = [
+        re.compile(pattern, re.IGNORECASE)
+        for pattern in (
             r'\b(timeout|timed?\s*out)\b',
             r'\b(connection\s+(?:refused|reset|closed|failed))\b',
             r'\b(null\s*pointer|none\s*type|undefined)\b',
@@ -245,79 +255,114 @@ class EntityExtractor:
             r'\b(deadlock|race\s+condition)\b',
             r'\b(memory\s+leak)\b',
             r'\b(stack\s+overflow)\b',
-        ]
+        )
+    ]
+    
+    def extract(self, text: str) -> Dict[str, List[str]]:
+        """
+        从文本中提取所有实体
+        
+        合并后的正则从左到右只扫描一次，同一实体类型内按出现位置排序；
+        与其他实体重叠的片段只计入最先匹配的一个。
+        """
+        # dict 去重：O(1) 判重且保持首次出现的顺序
+        found: Dict[str, Dict[str, None]] = {}
+        for match in self.COMBINED_PATTERN.finditer(text):
+            entity_type, group = self.GROUP_TARGETS[match.lastgroup]
+            found.setdefault(entity_type, {})[match.group(group)] = None
         
-        for pattern in error_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            keywords.extend(matches)
+        return {
+            entity_type: list(found[entity_type])
+            for entity_type in self.PATTERNS
+            if entity_type in found
+        }
+    
+    def extract_error_keywords(self, text: str) -> List[str]:
+        """提取错误关键词"""
+        keywords = []
+        
+        for pattern in self.ERROR_KEYWORD_PATTERNS:
+            keywords.extend(pattern.findall(text))
         
         return list(set(keywords))
 
 
+# 实体提取器不持有状态，全局共用一个实例
+_ENTITY_EXTRACTOR = EntityExtractor()
+
+
 class LogAggregator:
     """日志聚合器 - 基于 trace_id 等聚合相关日志"""
     
+    # 常见时间戳格式（ISO 8601 / Apache access log），合并为一个正则
+    TIMESTAMP_PATTERN = re.compile(
+        r'(\d{4}-\d{2}-\d{2}[T\s]\d{2}:\d{2}:\d{2})|(\d{2}/\w{3}/\d{4}:\d{2}:\d{2}:\d{2})'
+    )
+    
+    # 错误级别日志的特征（合并为一个正则，每条日志只扫描一次）
+    ERROR_INDICATOR_PATTERN = re.compile(
+        r'\b(?:ERROR|FATAL|CRITICAL|SEVERE|Exception|Error|Failure|failed|failure|error)\b',
+        re.IGNORECASE
+    )
+    
     def __init__(self):
-        self.entity_extractor = EntityExtractor()
+        self.entity_extractor = _ENTITY_EXTRACTOR
     
     def aggregate_by_trace(
         self, 
         logs: List[str], 
         trace_id: Optional[str] = None
     ) -> List[str]:
-        """按 trace_id 聚合日志"""
+        """按 trace_id 聚合日志（子串查找）"""
         if not trace_id:
             return logs
-        
-        related_logs = []
-        for log in logs:
-            if trace_id in log:
-                related_logs.append(log)
-        
-        return related_logs
+        return [log for log in logs if trace_id in log]
+    
+    def _extract_timestamp(self, log: str) -> str:
+        """提取日志中的第一个时间戳，没有时返回空串（排在最前）"""
+        match = self.TIMESTAMP_PATTERN.search(log)
+        if match:
+            return match.group(1) or match.group(2)
+        return ""
     
     def sort_by_timestamp(self, logs: List[str]) -> List[str]:
         """按时间戳排序日志"""
-        # 常见时间戳格式
-        timestamp_patterns = [
-            r'(\d{4}-\d{2}-\d{2}[T\s]\d{2}:\d{2}:\d{2})',
-            r'(\d{2}/\w{3}/\d{4}:\d{2}:\d{2}:\d{2})',
-        ]
-        
-        def extract_timestamp(log: str) -> str:
-            for pattern in timestamp_patterns:
-                match = re.search(pattern, log)
-                if match:
-                    return match.group(1)
-            return ""
+        return sorted(logs, key=self._extract_timestamp)
+    
+    def filter_and_sort(self, logs: List[str], trace_id: Optional[str] = None) -> List[str]:
+        """
+        按 trace_id 过滤并按时间戳排序
         
-        return sorted(logs, key=extract_timestamp)
+        等价于 aggregate_by_trace 后再 sort_by_timestamp，但只遍历一次日志，过滤的同时提取排序键。
+        """
+        if trace_id:
+            keyed = [(self._extract_timestamp(log), log) for log in logs if trace_id in log]
+        else:
+            keyed = [(self._extract_timestamp(log), log) for log in logs]
+        keyed.sort(key=itemgetter(0))
+        return [log for _, log in keyed]
     
     def extract_error_logs(self, logs: List[str]) -> List[str]:
         """提取错误级别的日志"""
-        error_indicators = [
-            r'\b(ERROR|FATAL|CRITICAL|SEVERE)\b',
-            r'\b(Exception|Error|Failure)\b',
-            r'\b(failed|failure|error)\b',
-        ]
-        
-        error_logs = []
-        for log in logs:
-            for pattern in error_indicators:
-                if re.search(pattern, log, re.IGNORECASE):
-                    error_logs.append(log)
-                    break
-        
-        return error_logs
+        search = self.ERROR_INDICATOR_PATTERN.search
+        return [log for log in logs if search(log)]
+
+
+# 默认配置的子模块全局共用，堆栈解析缓存也随之在各 Preprocessor 之间共享
+_LOG_AGGREGATOR = LogAggregator()
+_DEFAULT_STACK_PARSER = StackParser()
 
 
 class Preprocessor:
     """预处理器 - 组合各个子模块"""
     
     def __init__(self, business_package: str = "copilot"):
-        self.stack_parser = StackParser(business_package)
-        self.entity_extractor = EntityExtractor()
-        self.log_aggregator = LogAggregator()
+        if business_package == _DEFAULT_STACK_PARSER.business_package:
+            self.stack_parser = _DEFAULT_STACK_PARSER
+        else:
+            self.stack_parser = StackParser(business_package)
+        self.entity_extractor = _ENTITY_EXTRACTOR
+        self.log_aggregator = _LOG_AGGREGATOR
     
     def process(self, bug_input: Dict[str, Any]) -> Dict[str, Any]:
         """预处理 Bug 输入"""
@@ -331,39 +376,24 @@ class Preprocessor:
         }
         
         # 解析堆栈
-        error_info = bug_input.get("error_info", {})
-        stack_trace = error_info.get("stack_trace", "")
+        error_info = bug_input.get("error_info") or {}
+        context = bug_input.get("context") or {}
+        stack_trace = error_info.get("stack_trace") or ""
         if stack_trace:
+            # 直接保存解析对象，下游按属性访问，不再转换为字典
             parsed = self.stack_parser.parse(stack_trace)
-            result["parsed_stack"] = {
-                "exception_type": parsed.exception_type,
-                "exception_message": parsed.exception_message,
-                "frames": [
-                    {
-                        "file": f.file,
-                        "line": f.line,
-                        "function": f.function,
-                        "code": f.code,
-                        "is_framework": f.is_framework
-                    }
-                    for f in parsed.frames
-                ],
-                "root_frame": {
-                    "file": parsed.root_frame.file,
-                    "line": parsed.root_frame.line,
-                    "function": parsed.root_frame.function,
-                } if parsed.root_frame else None
-            }
-            result["business_frames"] = [
-                f for f in result["parsed_stack"]["frames"] 
-                if not f["is_framework"]
-            ]
+            result["parsed_stack"] = parsed
+            result["business_frames"] = self.stack_parser.get_business_frames(parsed)
         
-        # 提取实体
+        # 提取实体：完整解析出异常和帧的堆栈不再整段重扫，只取异常信息和各帧源码行
+        if self.stack_parser.is_fully_parsed(result["parsed_stack"]):
+            stack_text = self._stack_text(result["parsed_stack"])
+        else:
+            stack_text = stack_trace
         text_to_analyze = " ".join([
             error_info.get("error_message", ""),
-            stack_trace,
-            bug_input.get("context", {}).get("user_description", "") or "",
+            stack_text,
+            context.get("user_description") or "",
         ])
         result["entities"] = self.entity_extractor.extract(text_to_analyze)
         result["error_keywords"] = self.entity_extractor.extract_error_keywords(
@@ -374,11 +404,16 @@ class Preprocessor:
         related_logs = bug_input.get("related_logs", [])
         trace_id = error_info.get("trace_id")
         if related_logs:
-            result["aggregated_logs"] = self.log_aggregator.aggregate_by_trace(
+            result["aggregated_logs"] = self.log_aggregator.filter_and_sort(
                 related_logs, trace_id
             )
-            result["aggregated_logs"] = self.log_aggregator.sort_by_timestamp(
-                result["aggregated_logs"]
-            )
         
         return result
+    
+    @staticmethod
+    def _stack_text(parsed: ParsedStackTrace) -> str:
+        """堆栈中值得提取实体的文本：异常类型和消息、各帧源码行"""
+        return "\n".join([
+            f"{parsed.exception_type}: {parsed.exception_message}",
+            *(frame.code for frame in parsed.frames if frame.code)
+        ])
@@ -2,14 +2,29 @@
 检索模块 - 代码检索、Case 检索、多路召回
 """
 import asyncio
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass
+import heapq
+import logging
+import time
+from operator import itemgetter
+from typing import List, Dict, Any, Optional, Callable, Hashable, Awaitable
+from dataclasses import dataclass, replace
 from abc import ABC, abstractmethod
 
 from src.storage.vector_store import VectorStore
+from src.storage.response_cache import ResponseCache, ExactResponseCache
 
 
-@dataclass
+logger = logging.getLogger(__name__)
+
+
+# 检索结果缓存：告警风暴时同一错误会在短时间内被反复检索
+RETRIEVAL_CACHE_SIZE = 1024
+RETRIEVAL_CACHE_TTL = 300.0
+# 查询文本不同但查询向量余弦相似度达到该值时，复用已有检索结果
+RETRIEVAL_SEMANTIC_THRESHOLD = 0.95
+
+
+@dataclass(slots=True)
 class RetrievalResult:
     """检索结果"""
     source: str           # 来源：code, case, log_pattern
@@ -22,6 +37,93 @@ class RetrievalResult:
 class BaseRetriever(ABC):
     """检索器基类"""
     
+    # 结果来源标识
+    source: str = ""
+    
+    def __init__(self, vector_store: VectorStore):
+        self.vector_store = vector_store
+        self._cache: ExactResponseCache[tuple] = ExactResponseCache(
+            max_size=RETRIEVAL_CACHE_SIZE,
+            ttl=RETRIEVAL_CACHE_TTL
+        )
+        # 语义缓存：值为 (过期时间, 检索参数, 写入代数, 结果)
+        self._semantic_cache: ResponseCache[tuple] = ResponseCache(
+            max_size=RETRIEVAL_CACHE_SIZE,
+            threshold=RETRIEVAL_SEMANTIC_THRESHOLD
+        )
+    
+    async def _cached_search(
+        self,
+        query_text: str,
+        params: Hashable,
+        search_func: Callable[..., List[Dict[str, Any]]],
+        query_embedding: Optional[List[float]] = None,
+        **search_kwargs
+    ) -> List[RetrievalResult]:
+        """
+        带缓存的向量检索
+        
+        先按查询文本精确匹配，未命中且传入了查询向量时，再找查询向量足够相似的历史检索
+        （近似重复的告警），都未命中才查询向量库。
+        缓存项带上向量库的写入代数，库内容变化后旧结果自然失效；
+        TTL 兜底其他进程（如索引脚本）写入的情况。
+        缓存的是不可变元组，每次返回新列表，调用方修改列表不影响缓存。
+        
+        Args:
+            query_text: 查询文本
+            params: 除查询文本外影响结果的检索参数（top_k、过滤条件等）
+            search_func: 向量库检索方法
+            query_embedding: 可选的预计算查询向量
+            search_kwargs: 传给 search_func 的其他参数
+        """
+        generation = self.vector_store.generation
+        key = (query_text, params, generation)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return list(cached)
+        
+        if query_embedding is not None:
+            cached = self._semantic_lookup(query_embedding, params, generation)
+        
+        if cached is None:
+            # 向量检索是同步阻塞调用，放到线程中执行，避免阻塞事件循环
+            results = await asyncio.to_thread(
+                search_func, query_embedding=query_embedding, **search_kwargs
+            )
+            cached = tuple(
+                RetrievalResult(
+                    source=self.source,
+                    id=r["id"],
+                    content=r["content"],
+                    score=r.get("similarity", 0.5),
+                    metadata=r.get("metadata", {})
+                )
+                for r in results
+            )
+            if query_embedding is not None:
+                self._semantic_cache.add(
+                    query_embedding,
+                    (time.monotonic() + RETRIEVAL_CACHE_TTL, params, generation, cached)
+                )
+        
+        self._cache.add(key, cached)
+        return list(cached)
+    
+    def _semantic_lookup(
+        self,
+        query_embedding: List[float],
+        params: Hashable,
+        generation: int
+    ) -> Optional[tuple]:
+        """查找查询向量最相似的历史检索，参数、写入代数一致且未过期时返回其结果"""
+        entry = self._semantic_cache.get(query_embedding)
+        if entry is None:
+            return None
+        expires_at, entry_params, entry_generation, results = entry
+        if entry_params != params or entry_generation != generation or expires_at <= time.monotonic():
+            return None
+        return results
+    
     @abstractmethod
     async def search(
         self, 
@@ -36,14 +138,14 @@ class BaseRetriever(ABC):
 class CodeRetriever(BaseRetriever):
     """代码检索器"""
     
-    def __init__(self, vector_store: VectorStore):
-        self.vector_store = vector_store
+    source = "code"
     
     async def search(
         self,
         query: str,
         top_k: int = 5,
         file_filter: Optional[str] = None,
+        query_embedding: Optional[List[float]] = None,
         **kwargs
     ) -> List[RetrievalResult]:
         """
@@ -53,27 +155,21 @@ class CodeRetriever(BaseRetriever):
             query: 查询文本（错误信息、函数名等）
             top_k: 返回数量
             file_filter: 可选的文件路径过滤
+            query_embedding: 可选的预计算查询向量
         """
         where = None
         if file_filter:
             where = {"file_path": {"$contains": file_filter}}
         
-        results = self.vector_store.search_code(
+        return await self._cached_search(
+            query,
+            (top_k, file_filter),
+            self.vector_store.search_code,
+            query_embedding=query_embedding,
             query=query,
             n_results=top_k,
             where=where
         )
-        
-        return [
-            RetrievalResult(
-                source="code",
-                id=r["id"],
-                content=r["content"],
-                score=r.get("similarity", 0.5),
-                metadata=r.get("metadata", {})
-            )
-            for r in results
-        ]
     
     async def search_by_file(
         self,
@@ -92,14 +188,14 @@ class CodeRetriever(BaseRetriever):
 class CaseRetriever(BaseRetriever):
     """历史 Case 检索器"""
     
-    def __init__(self, vector_store: VectorStore):
-        self.vector_store = vector_store
+    source = "case"
     
     async def search(
         self,
         query: str,
         top_k: int = 5,
         tags: Optional[List[str]] = None,
+        query_embedding: Optional[List[float]] = None,
         **kwargs
     ) -> List[RetrievalResult]:
         """
@@ -109,35 +205,29 @@ class CaseRetriever(BaseRetriever):
             query: 查询文本（错误描述、异常类型等）
             top_k: 返回数量
             tags: 可选的标签过滤
+            query_embedding: 可选的预计算查询向量
         """
         # TODO: 支持标签过滤
-        results = self.vector_store.search_cases(
+        return await self._cached_search(
+            query,
+            top_k,
+            self.vector_store.search_cases,
+            query_embedding=query_embedding,
             query=query,
             n_results=top_k
         )
-        
-        return [
-            RetrievalResult(
-                source="case",
-                id=r["id"],
-                content=r["content"],
-                score=r.get("similarity", 0.5),
-                metadata=r.get("metadata", {})
-            )
-            for r in results
-        ]
 
 
 class LogPatternRetriever(BaseRetriever):
     """日志模式检索器"""
     
-    def __init__(self, vector_store: VectorStore):
-        self.vector_store = vector_store
+    source = "log_pattern"
     
     async def search(
         self,
         query: str,
         top_k: int = 3,
+        query_embedding: Optional[List[float]] = None,
         **kwargs
     ) -> List[RetrievalResult]:
         """
@@ -146,22 +236,16 @@ class LogPatternRetriever(BaseRetriever):
         Args:
             query: 错误日志文本
             top_k: 返回数量
+            query_embedding: 可选的预计算查询向量
         """
-        results = self.vector_store.search_log_patterns(
+        return await self._cached_search(
+            query,
+            top_k,
+            self.vector_store.search_log_patterns,
+            query_embedding=query_embedding,
             error_text=query,
             n_results=top_k
         )
-        
-        return [
-            RetrievalResult(
-                source="log_pattern",
-                id=r["id"],
-                content=r["content"],
-                score=r.get("similarity", 0.5),
-                metadata=r.get("metadata", {})
-            )
-            for r in results
-        ]
 
 
 class HybridRetriever:
@@ -179,6 +263,7 @@ class HybridRetriever:
             vector_store: 向量存储实例
             weights: 各检索器权重，默认为 {"code": 0.3, "case": 0.5, "log_pattern": 0.2}
         """
+        self.vector_store = vector_store
         self.code_retriever = CodeRetriever(vector_store)
         self.case_retriever = CaseRetriever(vector_store)
         self.log_pattern_retriever = LogPatternRetriever(vector_store)
@@ -212,9 +297,6 @@ class HybridRetriever:
         Returns:
             按来源分组的检索结果
         """
-        tasks = []
-        task_sources = []
-        
         # 构建各路检索查询
         code_query = error_message or query
         if stack_trace:
@@ -224,33 +306,63 @@ class HybridRetriever:
         case_query = query
         log_query = error_message or query
         
+        queries = {}
+        if enable_code:
+            queries["code"] = code_query
+        if enable_case:
+            queries["case"] = case_query
+        if enable_log_pattern:
+            queries["log_pattern"] = log_query
+        
+        # 各路查询向量一次批量计算，不再各自调用 embedding 模型；
+        # 批量计算失败时由各路检索自行计算，失败按单路处理
+        embeddings = {}
+        if queries:
+            try:
+                vectors = await asyncio.to_thread(
+                    self.vector_store.embed_queries, list(queries.values())
+                )
+                embeddings = dict(zip(queries, vectors))
+            except Exception as e:
+                logger.warning("batch query embedding failed: %s", e)
+        
         # 并行执行多路检索
+        searches = {}
         if enable_code:
-            tasks.append(self.code_retriever.search(code_query, top_k))
-            task_sources.append("code")
+            searches["code"] = self.code_retriever.search(
+                code_query, top_k, query_embedding=embeddings.get("code")
+            )
         
         if enable_case:
-            tasks.append(self.case_retriever.search(case_query, top_k))
-            task_sources.append("case")
+            searches["case"] = self.case_retriever.search(
+                case_query, top_k, query_embedding=embeddings.get("case")
+            )
         
         if enable_log_pattern:
-            tasks.append(self.log_pattern_retriever.search(log_query, top_k))
-            task_sources.append("log_pattern")
-        
-        # 并行执行
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+            searches["log_pattern"] = self.log_pattern_retriever.search(
+                log_query, top_k, query_embedding=embeddings.get("log_pattern")
+            )
         
-        # 组织结果
-        retrieval_results = {}
-        for source, result in zip(task_sources, results):
-            if isinstance(result, Exception):
-                print(f"Warning: {source} retrieval failed: {result}")
-                retrieval_results[source] = []
-            else:
-                retrieval_results[source] = result
+        # 预先按来源顺序占位，保证结果顺序与完成先后无关
+        retrieval_results = {source: [] for source in searches}
+        async with asyncio.TaskGroup() as tg:
+            for source, coro in searches.items():
+                tg.create_task(self._collect(source, coro, retrieval_results))
         
         return retrieval_results
     
+    @staticmethod
+    async def _collect(
+        source: str,
+        coro: Awaitable[List[RetrievalResult]],
+        retrieval_results: Dict[str, List[RetrievalResult]]
+    ):
+        """执行单路检索并写入结果；失败时记为空结果，不影响其他检索路"""
+        try:
+            retrieval_results[source] = await coro
+        except Exception as e:
+            logger.warning("%s retrieval failed: %s", source, e)
+    
     def merge_and_rerank(
         self,
         results: Dict[str, List[RetrievalResult]],
@@ -267,29 +379,39 @@ class HybridRetriever:
             合并后的排序结果
         """
         # 应用权重
-        scored_results = []
-        for source, items in results.items():
-            weight = self.weights.get(source, 0.1)
-            for item in items:
-                # 加权分数
-                weighted_score = item.score * weight
-                scored_results.append((weighted_score, item))
+        scored_results = [
+            (item.score * self.weights.get(source, 0.1), item)
+            for source, items in results.items()
+            for item in items
+        ]
         
-        # 排序
-        scored_results.sort(key=lambda x: x[0], reverse=True)
+        # 只取前 2 * top_k 个候选，去重后不足 top_k 且还有剩余时再完整排序
+        candidates = heapq.nlargest(top_k * 2, scored_results, key=itemgetter(0))
+        unique_results = self._dedup(candidates, top_k)
+        if len(unique_results) < top_k and len(candidates) < len(scored_results):
+            scored_results.sort(key=itemgetter(0), reverse=True)
+            unique_results = self._dedup(scored_results, top_k)
         
-        # 去重（基于 content 的前 100 字符）
-        seen = set()
+        return unique_results
+    
+    @staticmethod
+    def _dedup(
+        scored_results: List[tuple],
+        top_k: int
+    ) -> List[RetrievalResult]:
+        """按分数顺序去重（基于 content 的前 100 字符），取满 top_k 即停止"""
+        # 只保存前 100 字符的哈希值，不保留切片字符串
+        seen: set[int | str] = set()
         unique_results = []
         for score, item in scored_results:
-            key = item.content[:100] if item.content else item.id
+            key = hash(item.content[:100]) if item.content else item.id
             if key not in seen:
                 seen.add(key)
-                # 更新为加权后的分数
-                item.score = score
-                unique_results.append(item)
-        
-        return unique_results[:top_k]
+                # 更新为加权后的分数（复制一份，检索缓存中的结果保持不变）
+                unique_results.append(replace(item, score=score))
+                if len(unique_results) >= top_k:
+                    break
+        return unique_results
     
     async def retrieve(
         self,
@@ -1,7 +1,7 @@
 """
 数据模型定义 - Bug 输入、分析结果、历史 Case 等
 """
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from enum import Enum
@@ -118,8 +118,12 @@ class BugInput(BaseModel):
 
 # ============ 分析结果模型 ============
 
+# 分析结果的子结构创建后不再修改，设为不可变以便在结果之间安全共享（缓存复用等）
+
 class CodeLocation(BaseModel):
     """代码定位"""
+    model_config = ConfigDict(frozen=True)
+    
     file: str
     line_start: Optional[int] = None  # 允许为空，LLM 可能无法确定具体行号
     line_end: Optional[int] = None
@@ -129,6 +133,8 @@ class CodeLocation(BaseModel):
 
 class RootCause(BaseModel):
     """根因分析"""
+    model_config = ConfigDict(frozen=True)
+    
     description: str
     category: BugCategory
     confidence: float = Field(ge=0, le=1)
@@ -136,6 +142,8 @@ class RootCause(BaseModel):
 
 class FixSuggestion(BaseModel):
     """修复建议"""
+    model_config = ConfigDict(frozen=True)
+    
     fix_type: FixType
     description: str
     code_diff: Optional[str] = None
@@ -145,6 +153,8 @@ class FixSuggestion(BaseModel):
 
 class ImpactAssessment(BaseModel):
     """影响评估"""
+    model_config = ConfigDict(frozen=True)
+    
     affected_users: Optional[str] = None
     affected_features: List[str] = Field(default_factory=list)
     urgency: BugSeverity = BugSeverity.P2
@@ -152,6 +162,8 @@ class ImpactAssessment(BaseModel):
 
 class SimilarCase(BaseModel):
     """相似历史 Case"""
+    model_config = ConfigDict(frozen=True)
+    
     case_id: str
     title: str
     similarity: float
@@ -187,6 +199,9 @@ class AnalysisResult(BaseModel):
     
     # 原始检索结果（调试用）
     retrieval_context: Optional[Dict[str, Any]] = None
+    
+    # 是否复用了相似问题的缓存结果
+    is_cached: bool = False
 
 
 # ============ 历史 Case 模型 ============
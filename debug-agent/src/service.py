@@ -1,15 +1,38 @@
 """
 Debug Agent 主服务 - 编排预处理、检索、分析的完整流程
 """
-import uuid
-from typing import Dict, Any, Optional
+import secrets
+import asyncio
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Callable, TypeVar
 from datetime import datetime
 
-from src.models.schemas import BugInput, AnalysisResult, HistoryCase
+import orjson
+
+from src.models.schemas import BugInput, AnalysisResult, HistoryCase, BugCategory
 from src.core.preprocessor import Preprocessor
 from src.core.retriever import HybridRetriever
 from src.core.analyzer import LLMAnalyzer
 from src.storage.vector_store import VectorStore
+from src.storage.response_cache import ResponseCache, ExactResponseCache
+from src.storage.embedding_cache import EmbeddingCache
+from src.storage.analysis_store import AnalysisStore
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 通过 API 提交的历史 Case 先进入队列，攒够一批或等待一段时间后批量写入
+CASE_FLUSH_SIZE = 500
+CASE_FLUSH_INTERVAL = 2.0  # 秒
+
+
+class _AnalysisCancelled(Exception):
+    """负责分析的请求被取消；等待同一次分析的其他请求收到后自行重新分析"""
 
 
 class DebugAgentService:
@@ -20,7 +43,24 @@ class DebugAgentService:
         openai_api_key: str,
         llm_model: str = "gpt-4-turbo-preview",
         openai_base_url: Optional[str] = None,
-        chroma_persist_dir: str = "./data/chroma"
+        chroma_persist_dir: str = "./data/chroma",
+        embedding_cache_path: Optional[str] = "./data/embed_cache.sqlite",
+        analysis_history_path: Optional[str] = "./data/analyses.sqlite",
+        analysis_history_size: int = 1000,
+        embedding_backend: str = "minilm",
+        embedding_model: str = "text-embedding-3-small",
+        tei_url: str = "http://localhost:8080",
+        verify_ssl: bool = False,
+        vector_backend: str = "chroma",
+        faiss_index_type: str = "flat",
+        binary_log_patterns: bool = False,
+        response_cache_size: int = 1024,
+        response_cache_threshold: float = 0.95,
+        exact_cache_size: int = 512,
+        exact_cache_ttl: int = 900,
+        llm_batch_size: int = 8,
+        llm_batch_wait_ms: int = 50,
+        pattern_fast_path_threshold: float = 0.9
     ):
         """
         初始化 Debug Agent 服务
@@ -30,20 +70,80 @@ class DebugAgentService:
             llm_model: LLM 模型名称
             openai_base_url: OpenAI API 基础 URL
             chroma_persist_dir: ChromaDB 持久化目录
+            embedding_cache_path: 历史 Case 向量缓存路径（None 表示不缓存）
+            analysis_history_path: 分析历史 SQLite 路径（None 表示只保留内存中的最近结果）
+            analysis_history_size: 内存中保留的最近分析结果数
+            embedding_backend: embedding 后端（minilm、sentence_transformers、openai 或 tei）
+            embedding_model: OpenAI embedding 模型名称
+            tei_url: text-embeddings-inference 服务地址（tei 后端使用）
+            verify_ssl: LLM 请求是否验证 SSL 证书（公司代理可能需要禁用）
+            vector_backend: 向量后端（chroma 或 faiss）
+            faiss_index_type: faiss 后端的索引类型（flat、sq8、hnsw 或 hnsw_sq8）
+            binary_log_patterns: faiss 后端下日志模式集合是否使用二值量化
+            response_cache_size: 语义响应缓存容量（0 表示禁用）
+            response_cache_threshold: 语义响应缓存命中的最小余弦相似度
+            exact_cache_size: 精确响应缓存容量（0 表示禁用）
+            exact_cache_ttl: 精确响应缓存有效期（秒）
+            llm_batch_size: 合并为一次 LLM 调用的最大并发请求数（1 表示不合并）
+            llm_batch_wait_ms: 合并请求时的最长等待时间（毫秒）
+            pattern_fast_path_threshold: 跳过 LLM、直接按日志模式给出结果的最低匹配分数（大于 1 表示禁用）
         """
         # 初始化组件
         self.preprocessor = Preprocessor()
-        self.vector_store = VectorStore(persist_directory=chroma_persist_dir)
+        self.vector_store = VectorStore(
+            persist_directory=chroma_persist_dir,
+            embedding_backend=embedding_backend,
+            openai_api_key=openai_api_key,
+            openai_base_url=openai_base_url,
+            embedding_model=embedding_model,
+            tei_url=tei_url,
+            vector_backend=vector_backend,
+            faiss_index_type=faiss_index_type,
+            binary_log_patterns=binary_log_patterns
+        )
         self.retriever = HybridRetriever(self.vector_store)
         self.analyzer = LLMAnalyzer(
             api_key=openai_api_key,
             model=llm_model,
             base_url=openai_base_url,
-            verify_ssl=False  # 禁用 SSL 验证以解决代理/证书问题
+            verify_ssl=verify_ssl,
+            batch_size=llm_batch_size,
+            batch_wait_ms=llm_batch_wait_ms,
+            pattern_fast_path_threshold=pattern_fast_path_threshold
         )
         
-        # 存储分析历史（简单内存存储，生产环境应使用数据库）
-        self._analysis_history: Dict[str, AnalysisResult] = {}
+        # 分析历史：最近的结果缓存在内存中，全部结果落盘到 SQLite
+        self._analysis_history = AnalysisStore(analysis_history_path, max_size=analysis_history_size)
+        
+        # 知识库写入（embedding + 向量插入）使用独立线程池，避免占用检索所用的默认线程池
+        self._write_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="vector-write")
+        
+        # 历史 Case 向量按内容哈希缓存，重复提交或更新相同内容时不再重新计算
+        self._embedding_cache: Optional[EmbeddingCache] = None
+        if embedding_cache_path:
+            self._embedding_cache = EmbeddingCache(
+                embedding_cache_path,
+                namespace=self.vector_store.embedding_model
+            )
+        
+        # 待写入的历史 Case 队列及定时刷新任务
+        self._case_queue: List[HistoryCase] = []
+        self._case_flush_task: Optional[asyncio.Task] = None
+        
+        # 语义响应缓存（告警风暴时相同错误重复提交，直接复用分析结果）
+        self._response_cache: Optional[ResponseCache[AnalysisResult]] = None
+        self._response_cache_generation = 0  # 缓存内容对应的知识库版本，知识库更新后整体失效
+        if response_cache_size > 0:
+            self._response_cache = ResponseCache(
+                max_size=response_cache_size,
+                threshold=response_cache_threshold
+            )
+        
+        # 精确响应缓存：Bug 内容哈希 -> 分析结果；同一内容并发提交时只分析一次
+        self._exact_cache: Optional[ExactResponseCache[AnalysisResult]] = None
+        if exact_cache_size > 0:
+            self._exact_cache = ExactResponseCache(max_size=exact_cache_size, ttl=exact_cache_ttl)
+        self._inflight: Dict[str, "asyncio.Future[AnalysisResult]"] = {}
     
     async def analyze_bug(self, bug_input: BugInput) -> AnalysisResult:
         """
@@ -55,47 +155,130 @@ class DebugAgentService:
         Returns:
             分析结果
         """
-        print(f"[DEBUG] 开始分析 Bug...")
+        logger.debug("开始分析 Bug...")
         
-        # 生成 bug_id（如果没有提供）
+        # 生成 bug_id（如果没有提供）：高位为纳秒时间戳，按 ID 排序即按时间排序
         if not bug_input.bug_id:
-            bug_input.bug_id = f"BUG-{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+            bug_input.bug_id = f"BUG-{time.time_ns():016x}-{secrets.randbits(24):06x}"
+        
+        logger.debug("Bug ID: %s", bug_input.bug_id)
         
-        print(f"[DEBUG] Bug ID: {bug_input.bug_id}")
+        if self._exact_cache is None:
+            return await self._analyze_bug(bug_input)
         
-        # 1. 预处理
-        print(f"[DEBUG] 1. 预处理...")
+        # 精确缓存：内容相同的 Bug 直接复用结果；正在分析中的相同 Bug 等待同一次分析
+        key = self._content_key(bug_input)
+        while True:
+            cached = self._exact_cache.get(key)
+            if cached is None and key in self._inflight:
+                try:
+                    cached = await asyncio.shield(self._inflight[key])
+                except _AnalysisCancelled:
+                    # 只有发起分析的请求被取消，本请求重新检查缓存，必要时自己分析
+                    continue
+            break
+        if cached is not None:
+            logger.debug("命中精确缓存: %s", cached.analysis_id)
+            return self._reuse_result(cached, bug_input)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._analyze_bug(bug_input)
+        except asyncio.CancelledError:
+            # 不能直接取消 future，否则所有等待中的请求都会收到 CancelledError
+            future.set_exception(_AnalysisCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # 无人等待时不报 "exception was never retrieved"
+            raise
+        else:
+            future.set_result(result)
+            if result.root_cause.category != BugCategory.UNKNOWN:
+                self._exact_cache.add(key, result)
+            return result
+        finally:
+            del self._inflight[key]
+    
+    @staticmethod
+    def _content_key(bug_input: BugInput) -> str:
+        """Bug 内容的 BLAKE2b 哈希（不含 bug_id 和时间戳）"""
+        payload = bug_input.model_dump(mode="json", exclude={"bug_id", "timestamp"})
+        return hashlib.blake2b(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+    
+    def _reuse_result(self, cached: AnalysisResult, bug_input: BugInput) -> AnalysisResult:
+        """复制缓存的分析结果，换上新的分析 ID 并记入历史"""
+        result = cached.model_copy(update={
+            "analysis_id": secrets.token_hex(16),
+            "bug_id": bug_input.bug_id,
+            "created_at": datetime.now(),
+            "is_cached": True
+        })
+        self._analysis_history.put(result)
+        return result
+    
+    async def _analyze_bug(self, bug_input: BugInput) -> AnalysisResult:
+        """预处理、语义缓存、检索、LLM 分析"""
+        # 1. 预处理（纯 CPU 的正则匹配，在线程池中执行，日志较多时也不阻塞事件循环）
+        logger.debug("1. 预处理...")
         bug_dict = bug_input.model_dump()
-        preprocessed = self.preprocessor.process(bug_dict)
+        preprocessed = await asyncio.to_thread(self.preprocessor.process, bug_dict)
         
         # 2. 构建检索查询
-        print(f"[DEBUG] 2. 构建检索查询...")
+        logger.debug("2. 构建检索查询...")
         error_info = bug_input.error_info
         query = self._build_search_query(bug_input, preprocessed)
-        print(f"[DEBUG] 查询: {query[:100]}")
+        logger.debug("查询: %.100s", query)
+        
+        # 语义缓存：以检索查询加业务代码根帧为键，直接对原始文本计算向量（不经过归一化的查询缓存）
+        query_embedding = None
+        generation = self.vector_store.generation
+        if self._response_cache is not None:
+            if generation != self._response_cache_generation:
+                self._response_cache.clear()
+                self._response_cache_generation = generation
+            cache_text = self._response_cache_text(query, preprocessed)
+            query_embedding = (await asyncio.to_thread(self.vector_store.embed_documents, [cache_text]))[0]
+            cached = self._response_cache.get(query_embedding)
+            if cached is not None:
+                logger.debug("命中语义缓存: %s", cached.analysis_id)
+                return self._reuse_result(cached, bug_input)
         
         # 3. 多路检索
-        print(f"[DEBUG] 3. 多路检索...")
+        logger.debug("3. 多路检索...")
         retrieval_results = await self.retriever.search(
             query=query,
             error_message=error_info.error_message,
             stack_trace=error_info.stack_trace
         )
-        print(f"[DEBUG] 检索结果: code={len(retrieval_results.get('code', []))}, "
-              f"case={len(retrieval_results.get('case', []))}, "
-              f"log_pattern={len(retrieval_results.get('log_pattern', []))}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "检索结果: code=%d, case=%d, log_pattern=%d",
+                len(retrieval_results.get("code", [])),
+                len(retrieval_results.get("case", [])),
+                len(retrieval_results.get("log_pattern", []))
+            )
         
         # 4. LLM 分析
-        print(f"[DEBUG] 4. LLM 分析...")
+        logger.debug("4. LLM 分析...")
         result = await self.analyzer.analyze(
             bug_info=bug_dict,
             preprocessed=preprocessed,
             retrieval_results=retrieval_results
         )
-        print(f"[DEBUG] 分析完成: {result.summary[:50]}")
+        logger.debug("分析完成: %.50s", result.summary)
         
-        # 5. 保存分析结果
-        self._analysis_history[result.analysis_id] = result
+        # 5. 保存分析结果（未能识别根因的结果不缓存，下次重新分析）
+        self._analysis_history.put(result)
+        # 分析期间知识库有更新时，结果可能基于旧的 Case 和模式，同样不缓存
+        if (
+            query_embedding is not None
+            and result.root_cause.category != BugCategory.UNKNOWN
+            and generation == self.vector_store.generation == self._response_cache_generation
+        ):
+            self._response_cache.add(query_embedding, result)
         
         return result
     
@@ -104,25 +287,28 @@ class DebugAgentService:
         bug_input: BugInput,
         preprocessed: Dict[str, Any]
     ) -> str:
-        """构建检索查询"""
-        parts = []
-        
-        # 错误信息
-        parts.append(bug_input.error_info.error_message)
+        """构建检索查询：错误信息、异常类型、前 3 个错误关键词、用户描述（跳过空值）"""
+        parsed_stack = preprocessed.get("parsed_stack")
+        exception_type = parsed_stack.exception_type if parsed_stack else None
+        keywords = preprocessed.get("error_keywords") or ()
+        context = bug_input.context
+        user_description = context.user_description if context else None
         
-        # 异常类型
-        if preprocessed.get("parsed_stack", {}).get("exception_type"):
-            parts.append(preprocessed["parsed_stack"]["exception_type"])
-        
-        # 错误关键词
-        if preprocessed.get("error_keywords"):
-            parts.extend(preprocessed["error_keywords"][:3])
-        
-        # 用户描述
-        if bug_input.context and bug_input.context.user_description:
-            parts.append(bug_input.context.user_description)
-        
-        return " ".join(parts)
+        return " ".join(filter(None, (
+            bug_input.error_info.error_message,
+            exception_type,
+            *keywords[:3],
+            user_description
+        )))
+    
+    @staticmethod
+    def _response_cache_text(query: str, preprocessed: Dict[str, Any]) -> str:
+        """语义缓存的键文本：检索查询加业务代码中最底层的帧，错误信息为空或相同时也能区分出错位置"""
+        parsed_stack = preprocessed.get("parsed_stack")
+        root_frame = parsed_stack.root_frame if parsed_stack else None
+        if root_frame is None:
+            return query
+        return f"{query} {root_frame.file}:{root_frame.line} {root_frame.function}"
     
     def get_analysis(self, analysis_id: str) -> Optional[AnalysisResult]:
         """获取分析结果"""
@@ -130,29 +316,91 @@ class DebugAgentService:
     
     def list_analyses(self, limit: int = 20) -> list:
         """列出最近的分析结果"""
-        results = list(self._analysis_history.values())
-        results.sort(key=lambda x: x.created_at, reverse=True)
-        return results[:limit]
+        return self._analysis_history.recent(limit)
+    
+    async def warmup(self):
+        """预热外部连接"""
+        await self.analyzer.warmup()
     
     # ============ 知识库管理 ============
     
+    async def run_write(self, func: Callable[..., T], *args) -> T:
+        """在写入线程池中执行同步的知识库写操作"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._write_executor, func, *args)
+    
     def add_history_case(self, case: HistoryCase):
         """添加历史 Case 到知识库"""
-        embedding_text = case.embedding_text or case.generate_embedding_text()
+        self.add_history_cases([case])
+    
+    def add_history_cases(self, cases: List[HistoryCase]):
+        """批量添加历史 Case 到知识库（一次计算全部向量并分批写入）"""
+        if not cases:
+            return
         
-        self.vector_store.add_cases([{
-            "id": case.case_id,
-            "content": embedding_text,
-            "metadata": {
-                "title": case.problem.title,
-                "root_cause": case.resolution.root_cause,
-                "fix_type": case.resolution.fix_type.value,
-                "fix_detail": case.resolution.fix_detail,
-                "tags": ",".join(case.tags),
-                "resolver": case.resolver or "",
-                "created_at": case.created_at.isoformat()
+        texts = [case.embedding_text or case.generate_embedding_text() for case in cases]
+        
+        # 内容已写入过的 Case（重放、重复同步）直接跳过，不再计算向量和写入索引
+        new = self.vector_store.new_case_indices(texts)
+        if len(new) < len(cases):
+            logger.debug("跳过 %d 个内容重复的历史 Case", len(cases) - len(new))
+            if not new:
+                return
+            cases = [cases[i] for i in new]
+            texts = [texts[i] for i in new]
+        
+        embeddings = None
+        if self._embedding_cache is not None:
+            embeddings = self._embedding_cache.get_or_compute(texts, self.vector_store.embed_documents)
+        
+        self.vector_store.add_cases([
+            {
+                "id": case.case_id,
+                "content": text,
+                "metadata": {
+                    "title": case.problem.title,
+                    "root_cause": case.resolution.root_cause,
+                    "fix_type": case.resolution.fix_type.value,
+                    "fix_detail": case.resolution.fix_detail,
+                    "tags": ",".join(case.tags),
+                    "resolver": case.resolver or "",
+                    "created_at": case.created_at.isoformat()
+                }
             }
-        }])
+            for case, text in zip(cases, texts)
+        ], embeddings=embeddings)
+        self.vector_store.persist()
+    
+    async def enqueue_history_case(self, case: HistoryCase):
+        """
+        将历史 Case 放入写入队列后立即返回
+        
+        队列达到 CASE_FLUSH_SIZE 条时立即写入，否则最迟 CASE_FLUSH_INTERVAL 秒后写入。
+        """
+        self._case_queue.append(case)
+        if len(self._case_queue) >= CASE_FLUSH_SIZE:
+            await self.flush_history_cases()
+        elif self._case_flush_task is None:
+            self._case_flush_task = asyncio.create_task(self._flush_history_cases_later())
+    
+    async def _flush_history_cases_later(self):
+        """等待刷新间隔后写入队列中的 Case"""
+        await asyncio.sleep(CASE_FLUSH_INTERVAL)
+        self._case_flush_task = None
+        await self.flush_history_cases()
+    
+    async def flush_history_cases(self):
+        """立即写入队列中的全部 Case"""
+        if self._case_flush_task is not None:
+            self._case_flush_task.cancel()
+            self._case_flush_task = None
+        
+        cases, self._case_queue = self._case_queue, []
+        if cases:
+            try:
+                await self.run_write(self.add_history_cases, cases)
+            except Exception as e:
+                logger.error("批量写入 %d 个历史 Case 失败: %s", len(cases), e)
     
     def add_code_snippet(
         self,
@@ -172,7 +420,17 @@ class DebugAgentService:
                 "start_line": start_line or 0
             }
         }])
+        self.vector_store.persist()
     
     def get_knowledge_stats(self) -> Dict[str, int]:
         """获取知识库统计"""
         return self.vector_store.get_stats()
+    
+    def close(self):
+        """等待未完成的写入并持久化索引"""
+        self._write_executor.shutdown(wait=True)
+        self.vector_store.persist()
+        self.vector_store.close()
+        if self._embedding_cache is not None:
+            self._embedding_cache.close()
+        self._analysis_history.close()
@@ -1,4 +1,7 @@
 """存储模块"""
 from .vector_store import VectorStore
+from .embedding_cache import EmbeddingCache
+from .response_cache import ResponseCache, ExactResponseCache
+from .analysis_store import AnalysisStore
 
-__all__ = ["VectorStore"]
+__all__ = ["VectorStore", "EmbeddingCache", "ResponseCache", "ExactResponseCache", "AnalysisStore"]
@@ -0,0 +1,96 @@
+"""
+向量打分内核 - 在候选向量上精确计算相似度并取 top-k
+
+安装了 numba 时使用 JIT 编译的并行内核，否则退化为 numpy 实现，结果一致。
+"""
+from typing import Tuple
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+
+def _topk_cosine_numpy(
+    query: np.ndarray,
+    matrix: np.ndarray,
+    k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """numpy 实现：矩阵乘打分，argpartition 取前 k 个后再排序"""
+    scores = matrix @ query
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int32)
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return scores[top].astype(np.float32), top.astype(np.int32)
+
+
+if njit is not None:
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _dot_scores(query, matrix):
+        """按行并行计算内积"""
+        n, dim = matrix.shape
+        scores = np.empty(n, dtype=np.float32)
+        for i in prange(n):
+            acc = np.float32(0.0)
+            for j in range(dim):
+                acc += matrix[i, j] * query[j]
+            scores[i] = acc
+        return scores
+
+    @njit(cache=True)
+    def _select_topk(scores, k):
+        """插入法维护降序的前 k 个（k 远小于候选数，分数相同时行号小的在前）"""
+        best_scores = np.empty(k, dtype=np.float32)
+        best_rows = np.empty(k, dtype=np.int32)
+        count = 0
+        for i in range(len(scores)):
+            s = scores[i]
+            if count == k and s <= best_scores[k - 1]:
+                continue
+            pos = count if count < k else k - 1
+            while pos > 0 and best_scores[pos - 1] < s:
+                best_scores[pos] = best_scores[pos - 1]
+                best_rows[pos] = best_rows[pos - 1]
+                pos -= 1
+            best_scores[pos] = s
+            best_rows[pos] = i
+            if count < k:
+                count += 1
+        return best_scores[:count], best_rows[:count]
+
+
+def topk_cosine(
+    query: np.ndarray,
+    matrix: np.ndarray,
+    k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    计算查询向量与候选矩阵每一行的相似度，返回分数最高的 k 个
+
+    Args:
+        query: 已 L2 归一化的 float32 查询向量，形状 (d,)
+        matrix: 已 L2 归一化的 float32 候选矩阵，形状 (N, d)
+        k: 返回数量
+
+    Returns:
+        (scores, rows)：按分数降序排列的余弦相似度及对应的行号
+    """
+    if njit is None:
+        return _topk_cosine_numpy(query, matrix, k)
+
+    k = min(k, len(matrix))
+    if k <= 0:
+        return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int32)
+    scores = _dot_scores(
+        np.ascontiguousarray(query, dtype=np.float32),
+        np.ascontiguousarray(matrix, dtype=np.float32)
+    )
+    return _select_topk(scores, k)
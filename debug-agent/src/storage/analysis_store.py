@@ -0,0 +1,103 @@
+"""
+分析历史存储 - 近期结果保留在内存 LRU 中，全部结果写入 SQLite，内存占用有上界
+"""
+import heapq
+import sqlite3
+import threading
+from collections import OrderedDict
+from operator import attrgetter
+from pathlib import Path
+from typing import List, Optional
+
+from src.models.schemas import AnalysisResult
+
+
+class AnalysisStore:
+    """
+    分析结果存储
+
+    最近使用的 max_size 条结果缓存在内存中；配置了 path 时每条结果同时写入 SQLite，
+    内存淘汰后仍可按 ID 查询，列表按 created_at 索引取前 limit 条，不再全量排序。
+    """
+
+    def __init__(self, path: Optional[str] = "./data/analyses.sqlite", max_size: int = 1000):
+        """
+        Args:
+            path: SQLite 文件路径（None 表示只保留内存中的最近 max_size 条）
+            max_size: 内存中缓存的最大结果数
+        """
+        self.path = path
+        self.max_size = max_size
+        self._memory: "OrderedDict[str, AnalysisResult]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._conn: Optional[sqlite3.Connection] = None
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            # 每次分析都会写入一条，WAL + NORMAL 避免每次提交都 fsync
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS analyses "
+                "(analysis_id TEXT PRIMARY KEY, created_at REAL NOT NULL, data BLOB NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_analyses_created_at ON analyses (created_at DESC)"
+            )
+            self._conn.commit()
+
+    def put(self, result: AnalysisResult):
+        """保存分析结果"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO analyses (analysis_id, created_at, data) VALUES (?, ?, ?)",
+                    (result.analysis_id, result.created_at.timestamp(), result.model_dump_json())
+                )
+                self._conn.commit()
+            self._remember(result)
+
+    def get(self, analysis_id: str) -> Optional[AnalysisResult]:
+        """按 ID 获取分析结果，内存未命中时从 SQLite 读取"""
+        with self._lock:
+            result = self._memory.get(analysis_id)
+            if result is not None:
+                self._memory.move_to_end(analysis_id)
+                return result
+            if self._conn is None:
+                return None
+            row = self._conn.execute(
+                "SELECT data FROM analyses WHERE analysis_id = ?", (analysis_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            result = AnalysisResult.model_validate_json(row[0])
+            self._remember(result)
+            return result
+
+    def recent(self, limit: int = 20) -> List[AnalysisResult]:
+        """按创建时间倒序返回最近的 limit 条结果"""
+        with self._lock:
+            if self._conn is None:
+                return heapq.nlargest(limit, self._memory.values(), key=attrgetter("created_at"))
+            rows = self._conn.execute(
+                "SELECT analysis_id, data FROM analyses ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+            # 仍在内存中的结果直接复用，避免重复反序列化
+            return [
+                self._memory.get(analysis_id) or AnalysisResult.model_validate_json(data)
+                for analysis_id, data in rows
+            ]
+
+    def close(self):
+        """关闭 SQLite 连接"""
+        if self._conn is not None:
+            self._conn.close()
+
+    def _remember(self, result: AnalysisResult):
+        """放入内存 LRU，超出容量时淘汰最久未使用的一条（调用方持有锁）"""
+        self._memory[result.analysis_id] = result
+        self._memory.move_to_end(result.analysis_id)
+        if len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
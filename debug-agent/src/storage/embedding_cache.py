@@ -0,0 +1,104 @@
+"""
+Embedding 缓存 - 按内容哈希持久化缓存向量，重复内容不再重新计算
+"""
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Callable
+
+import numpy as np
+
+
+# 单条 SQL 的参数个数上限（旧版 SQLite 默认 999），批量查询按此分段
+LOOKUP_CHUNK_SIZE = 500
+
+
+class EmbeddingCache:
+    """基于 SQLite 的 embedding 缓存（键为内容哈希，值为 float32 向量字节）"""
+
+    def __init__(self, path: str = "./data/embed_cache.sqlite", namespace: str = ""):
+        """
+        Args:
+            path: 缓存文件路径
+            namespace: 缓存命名空间（通常是 embedding 模型名，换模型后缓存自动失效）
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.namespace = namespace
+
+        # 服务中的知识库写入在线程池中执行，连接跨线程共享，读写加锁
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (hash BLOB PRIMARY KEY, vec BLOB NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, content: str) -> bytes:
+        """计算内容的缓存键"""
+        return hashlib.blake2b(f"{self.namespace}\0{content}".encode("utf-8"), digest_size=16).digest()
+
+    def get_or_compute(
+        self,
+        texts: List[str],
+        embed_fn: Callable[[List[str]], List[List[float]]]
+    ) -> np.ndarray:
+        """
+        获取一批文本的向量，未命中的部分一次性批量计算并写入缓存
+
+        结果直接填入一个连续的 float32 矩阵，不再逐条转换为 Python 浮点数列表。
+
+        Args:
+            texts: 文本列表
+            embed_fn: 批量计算向量的函数
+
+        Returns:
+            与 texts 一一对应的 (N, d) float32 向量矩阵
+        """
+        keys = [self.make_key(t) for t in texts]
+        with self._lock:
+            found = {}
+            for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+                chunk = keys[start:start + LOOKUP_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                found.update(self._conn.execute(
+                    f"SELECT hash, vec FROM embeddings WHERE hash IN ({placeholders})", chunk
+                ))
+
+        missing = [i for i, k in enumerate(keys) if k not in found]
+        computed = None
+        if missing:
+            computed = np.asarray(embed_fn([texts[i] for i in missing]), dtype=np.float32)
+
+        if computed is not None:
+            dim = computed.shape[1]
+        elif found:
+            dim = len(next(iter(found.values()))) // 4
+        else:
+            dim = 0
+        embeddings = np.empty((len(texts), dim), dtype=np.float32)
+        for i, k in enumerate(keys):
+            if k in found:
+                embeddings[i] = np.frombuffer(found[k], dtype=np.float32)
+
+        if missing:
+            embeddings[missing] = computed
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (hash, vec) VALUES (?, ?)",
+                    [(keys[i], vec.tobytes()) for i, vec in zip(missing, computed)]
+                )
+                self._conn.commit()
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        return embeddings
+
+    def close(self):
+        """关闭缓存文件"""
+        self._conn.close()
@@ -0,0 +1,371 @@
+"""
+FAISS 向量集合 - 内积检索，接口与 ChromaDB Collection 保持一致
+"""
+import os
+import pickle
+import threading
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Callable, Tuple, Union
+
+import faiss
+import numpy as np
+
+from ._kernels import topk_cosine
+
+
+# 支持的索引类型
+INDEX_TYPES = ("flat", "sq8", "hnsw", "hnsw_sq8", "binary")
+
+# sq8 索引先用 int8 编码粗筛 k_factor * k 个候选，再用 float32 原始向量精排
+SQ8_REFINE_K_FACTOR = 2.0
+
+# 需要训练的量化索引：向量数达到 SQ8_MIN_TRAIN_SIZE 之前先用 float32 的 IndexFlatIP 精确检索，
+# 避免按首批写入的少量向量校准量化范围（之后写入的向量会全部落在范围之外）
+QUANTIZED_INDEX_TYPES = ("sq8", "hnsw_sq8")
+SQ8_MIN_TRAIN_SIZE = 4096
+
+# 8 bit 量化的每维取值范围最多按 10k 条向量（从已写入的向量中均匀抽样）校准
+SQ8_TRAIN_SIZE = 10000
+
+# hnsw 索引参数：每个节点的邻居数、建图和检索时的候选队列长度
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+
+class FaissCollection:
+    """
+    基于 FAISS 内积索引的向量集合
+
+    向量归一化后做内积即余弦相似度；文档和元数据保存在与索引行号对齐的列表中。
+    index_type 为 flat 时使用 IndexFlatIP 精确检索；为 sq8 时使用 8 bit 标量量化
+    （IndexScalarQuantizer）扫描，候选再由 IndexRefineFlat 按 float32 重新打分，
+    扫描的数据量约为 flat 的 1/4，返回的分数仍是精确内积（向量数达到 SQ8_MIN_TRAIN_SIZE
+    之前先用 IndexFlatIP，达到后用全部已写入向量训练量化范围并重建）；为 hnsw 时使用
+    IndexHNSWFlat 图检索，查询只访问少量节点，适合向量较多、以读为主的集合；
+    为 hnsw_sq8 时使用 IndexHNSWSQ，图中节点只保存 int8 编码，向量部分的内存约为
+    hnsw 的 1/4，分数为量化后的近似内积（与 sq8 相同，训练前先用 IndexFlatIP）；为 binary 时每维只保留符号位（1 bit），
+    用 IndexBinaryHNSW 按汉明距离检索，内存为 float32 的 1/32，
+    分数由汉明距离按 cos(π·h/d) 估计余弦相似度，适合召回要求高、精度要求低的集合。
+    add/query/get/count 的参数和返回结构与 ChromaDB Collection 相同，
+    VectorStore 可以直接替换使用。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        persist_directory: str,
+        embedding_function: Callable[[List[str]], List[List[float]]],
+        index_type: str = "flat"
+    ):
+        """
+        Args:
+            name: 集合名称（用作持久化文件名）
+            persist_directory: 持久化目录
+            embedding_function: 计算查询/文档向量的函数
+            index_type: 索引类型，flat、sq8、hnsw、hnsw_sq8 或 binary（已持久化的索引按原类型加载，切换后需重新索引）
+        """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"不支持的 FAISS 索引类型: {index_type}")
+
+        self.name = name
+        self.embedding_function = embedding_function
+        self.index_type = index_type
+
+        # 二值索引的读写接口不同，使用单独的文件名
+        self._binary = index_type == "binary"
+        index_name = f"{name}.binary" if self._binary else name
+        self._index_path = Path(persist_directory) / f"{index_name}.faiss"
+        self._docs_path = Path(persist_directory) / f"{name}.pkl"
+        Path(persist_directory).mkdir(parents=True, exist_ok=True)
+
+        self._index: Optional[Union[faiss.Index, faiss.IndexBinary]] = None
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._id_set: set = set()
+        self._dirty = False
+
+        # 检索与写入可能在不同线程中并发执行，FAISS 索引和并行列表需要加锁
+        self._lock = threading.Lock()
+
+        self._load()
+
+    # ============ 写入 ============
+
+    def add(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        embeddings: Optional[List[List[float]]] = None
+    ):
+        """添加向量（已存在的 id 会被跳过，与 ChromaDB add 行为一致）"""
+        metadatas = metadatas or [{} for _ in ids]
+        if embeddings is None:
+            embeddings = self.embedding_function(documents)
+        vectors = self._to_matrix(embeddings)
+
+        with self._lock:
+            keep = [i for i, id_ in enumerate(ids) if id_ not in self._id_set]
+            if not keep:
+                return
+
+            if self._index is None:
+                self._index = self._create_index(vectors[keep])
+            self._index.add(self._binarize(vectors[keep]) if self._binary else vectors[keep])
+            if self._awaiting_training() and self._index.ntotal >= SQ8_MIN_TRAIN_SIZE:
+                self._index = self._build_quantized_index()
+
+            for i in keep:
+                self._ids.append(ids[i])
+                self._documents.append(documents[i])
+                self._metadatas.append(metadatas[i])
+                self._id_set.add(ids[i])
+
+            self._dirty = True
+
+    def reset(self):
+        """清空集合并删除持久化文件"""
+        with self._lock:
+            self._index = None
+            self._ids, self._documents, self._metadatas = [], [], []
+            self._id_set = set()
+            self._dirty = False
+            for path in (self._index_path, self._docs_path):
+                if path.exists():
+                    path.unlink()
+
+    # ============ 查询 ============
+
+    def query(
+        self,
+        query_texts: Optional[List[str]] = None,
+        query_embeddings: Optional[List[List[float]]] = None,
+        n_results: int = 5,
+        where: Optional[Dict] = None
+    ) -> Dict[str, List[List[Any]]]:
+        """
+        向量检索
+
+        Returns:
+            ChromaDB 格式的结果，distances 为归一化向量的平方 L2 距离（2 - 2·cos）
+        """
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function(query_texts)
+        queries = self._to_matrix(query_embeddings)
+
+        with self._lock:
+            return self._search(queries, n_results, where)
+
+    def _search(
+        self,
+        queries: np.ndarray,
+        n_results: int,
+        where: Optional[Dict]
+    ) -> Dict[str, List[List[Any]]]:
+        """在已归一化的查询矩阵上执行检索（调用方持有锁）"""
+        empty = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if self._index is None or self._index.ntotal == 0:
+            for key in empty:
+                empty[key] = [[] for _ in range(len(queries))]
+            return empty
+
+        if self._binary:
+            scores, rows = self._search_binary(queries, n_results, where)
+        elif where:
+            scores, rows = self._search_filtered(queries, n_results, where)
+        else:
+            scores, rows = self._index.search(queries, min(n_results, self._index.ntotal))
+
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for q_scores, q_rows in zip(scores, rows):
+            ids, docs, metas, dists = [], [], [], []
+            for score, row in zip(q_scores, q_rows):
+                if row < 0:
+                    continue
+                ids.append(self._ids[row])
+                docs.append(self._documents[row])
+                metas.append(self._metadatas[row])
+                dists.append(float(2 - 2 * score))
+                if len(ids) >= n_results:
+                    break
+            results["ids"].append(ids)
+            results["documents"].append(docs)
+            results["metadatas"].append(metas)
+            results["distances"].append(dists)
+
+        return results
+
+    def _search_filtered(
+        self,
+        queries: np.ndarray,
+        n_results: int,
+        where: Dict
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """
+        带过滤条件的检索：先按元数据筛出候选行，只对候选的原始向量精确打分
+
+        不再对全部向量打分、排序后再过滤，过滤条件越严格，需要计算的向量越少。
+        """
+        candidates = np.array(
+            [row for row, metadata in enumerate(self._metadatas) if self._match(metadata, where)],
+            dtype=np.int64
+        )
+        if len(candidates) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return [empty] * len(queries), [empty] * len(queries)
+
+        matrix = self._index.reconstruct_batch(candidates)
+        scores, rows = [], []
+        for query in queries:
+            q_scores, q_rows = topk_cosine(query, matrix, n_results)
+            scores.append(q_scores)
+            rows.append(candidates[q_rows])
+        return scores, rows
+
+    def _search_binary(
+        self,
+        queries: np.ndarray,
+        n_results: int,
+        where: Optional[Dict]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """二值索引检索：按汉明距离检索，再换算为估计的余弦相似度"""
+        k = self._index.ntotal if where else min(n_results, self._index.ntotal)
+        hamming, rows = self._index.search(self._binarize(queries), k)
+        scores = np.cos(np.pi * hamming / self._index.d)
+
+        # 带过滤条件时对全部向量检索后过滤，不满足条件的行标记为 -1
+        if where:
+            matched = np.array([
+                [row >= 0 and self._match(self._metadatas[row], where) for row in q_rows]
+                for q_rows in rows
+            ])
+            rows = np.where(matched, rows, -1)
+        return scores, rows
+
+    def get(self, ids: Optional[List[str]] = None, **kwargs) -> Dict[str, List[Any]]:
+        """按 id 获取文档（不传 ids 返回全部）"""
+        with self._lock:
+            if ids is None:
+                rows = range(len(self._ids))
+            else:
+                wanted = set(ids)
+                rows = [i for i, id_ in enumerate(self._ids) if id_ in wanted]
+            return {
+                "ids": [self._ids[i] for i in rows],
+                "documents": [self._documents[i] for i in rows],
+                "metadatas": [self._metadatas[i] for i in rows],
+            }
+
+    def count(self) -> int:
+        """向量数量"""
+        return len(self._ids)
+
+    # ============ 持久化 ============
+
+    def persist(self):
+        """将索引和文档写入磁盘（仅在有新增时写入）"""
+        with self._lock:
+            if not self._dirty or self._index is None:
+                return
+
+            tmp_index = self._index_path.with_suffix(".faiss.tmp")
+            if self._binary:
+                faiss.write_index_binary(self._index, str(tmp_index))
+            else:
+                faiss.write_index(self._index, str(tmp_index))
+            os.replace(tmp_index, self._index_path)
+
+            tmp_docs = self._docs_path.with_suffix(".pkl.tmp")
+            with open(tmp_docs, "wb") as f:
+                pickle.dump((self._ids, self._documents, self._metadatas), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_docs, self._docs_path)
+
+            self._dirty = False
+
+    def _load(self):
+        """从磁盘加载索引和文档"""
+        if not (self._index_path.exists() and self._docs_path.exists()):
+            return
+
+        if self._binary:
+            self._index = faiss.read_index_binary(str(self._index_path))
+        else:
+            self._index = faiss.read_index(str(self._index_path))
+        with open(self._docs_path, "rb") as f:
+            self._ids, self._documents, self._metadatas = pickle.load(f)
+        self._id_set = set(self._ids)
+
+    # ============ 工具方法 ============
+
+    def _create_index(self, vectors: np.ndarray) -> Union[faiss.Index, faiss.IndexBinary]:
+        """创建空索引；量化索引在向量足够训练之前先用 IndexFlatIP"""
+        dim = vectors.shape[1]
+        if self.index_type == "flat" or self.index_type in QUANTIZED_INDEX_TYPES:
+            return faiss.IndexFlatIP(dim)
+        if self.index_type == "binary":
+            # 维度即编码的比特数，需为 8 的倍数
+            index = faiss.IndexBinaryHNSW(dim, HNSW_M)
+            index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+            return index
+        if self.index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+            return index
+
+        raise ValueError(f"不支持的 FAISS 索引类型: {self.index_type}")
+
+    def _awaiting_training(self) -> bool:
+        """量化索引是否仍在使用训练前的 IndexFlatIP（调用方持有锁）"""
+        return self.index_type in QUANTIZED_INDEX_TYPES and isinstance(self._index, faiss.IndexFlatIP)
+
+    def _build_quantized_index(self) -> faiss.Index:
+        """用已写入的全部向量训练量化索引并重建（调用方持有锁）"""
+        vectors = self._index.reconstruct_n(0, self._index.ntotal)
+        dim = vectors.shape[1]
+        if self.index_type == "hnsw_sq8":
+            index = faiss.IndexHNSWSQ(
+                dim, faiss.ScalarQuantizer.QT_8bit, HNSW_M, faiss.METRIC_INNER_PRODUCT
+            )
+            index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+        else:
+            quantizer = faiss.IndexScalarQuantizer(
+                dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+            )
+            index = faiss.IndexRefineFlat(quantizer)
+            index.k_factor = SQ8_REFINE_K_FACTOR
+
+        sample = np.linspace(0, len(vectors) - 1, min(len(vectors), SQ8_TRAIN_SIZE)).astype(np.int64)
+        index.train(vectors[sample])
+        index.add(vectors)
+        return index
+
+    @staticmethod
+    def _to_matrix(embeddings: List[List[float]]) -> np.ndarray:
+        """转换为归一化的连续 float32 矩阵"""
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    @staticmethod
+    def _binarize(vectors: np.ndarray) -> np.ndarray:
+        """按符号位二值化并打包为字节（每 8 维一个 uint8）"""
+        return np.packbits(vectors > 0, axis=1)
+
+    @staticmethod
+    def _match(metadata: Dict[str, Any], where: Dict[str, Any]) -> bool:
+        """简单的元数据过滤：支持相等判断和 $contains 子串匹配"""
+        for key, cond in where.items():
+            value = metadata.get(key)
+            if isinstance(cond, dict):
+                if "$contains" in cond and (value is None or cond["$contains"] not in str(value)):
+                    return False
+                if "$eq" in cond and value != cond["$eq"]:
+                    return False
+            elif value != cond:
+                return False
+        return True
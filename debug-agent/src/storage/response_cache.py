@@ -0,0 +1,130 @@
+"""
+响应缓存 - 与近期分析过的问题完全相同或足够相似时，直接复用之前的分析结果
+"""
+import time
+from collections import OrderedDict
+from typing import List, Optional, Generic, Hashable, TypeVar
+
+import numpy as np
+
+
+T = TypeVar("T")
+
+
+class ResponseCache(Generic[T]):
+    """
+    基于余弦相似度的 LRU 响应缓存
+
+    查询向量归一化后按行存放在定长矩阵中，一次矩阵乘法即可得到与全部缓存项的相似度；
+    缓存满时淘汰最久未命中的一项，并复用其所在行。
+    """
+
+    def __init__(self, max_size: int = 1024, threshold: float = 0.95):
+        """
+        Args:
+            max_size: 最大缓存条数
+            threshold: 命中所需的最小余弦相似度
+        """
+        self.max_size = max_size
+        self.threshold = threshold
+
+        self._vectors: Optional[np.ndarray] = None
+        self._values: List[Optional[T]] = [None] * max_size
+        self._lru: "OrderedDict[int, None]" = OrderedDict()  # 已占用的行号，按最近使用排序
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, embedding: List[float]) -> Optional[T]:
+        """查找与查询向量最相似的缓存项，相似度达到阈值时返回缓存值"""
+        if not self._lru:
+            self.misses += 1
+            return None
+
+        rows = np.fromiter(self._lru, dtype=np.int64, count=len(self._lru))
+        scores = self._vectors[rows] @ self._normalize(embedding)
+        best = int(np.argmax(scores))
+
+        if scores[best] < self.threshold:
+            self.misses += 1
+            return None
+
+        row = int(rows[best])
+        self._lru.move_to_end(row)
+        self.hits += 1
+        return self._values[row]
+
+    def add(self, embedding: List[float], value: T):
+        """写入缓存，满时淘汰最久未使用的一项"""
+        vector = self._normalize(embedding)
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+
+        if len(self._lru) < self.max_size:
+            row = len(self._lru)
+        else:
+            row, _ = self._lru.popitem(last=False)
+
+        self._vectors[row] = vector
+        self._values[row] = value
+        self._lru[row] = None
+
+    def clear(self):
+        """清空缓存（向量矩阵保留，行号重新从 0 分配）"""
+        self._values = [None] * self.max_size
+        self._lru.clear()
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        """转换为单位长度的 float32 向量"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+
+class ExactResponseCache(Generic[T]):
+    """
+    按内容哈希精确匹配的 LRU 响应缓存，缓存项超过 TTL 后失效
+
+    重复告警通常携带完全相同的错误和堆栈，命中时无需计算 embedding。
+    """
+
+    def __init__(self, max_size: int = 512, ttl: float = 900.0):
+        """
+        Args:
+            max_size: 最大缓存条数
+            ttl: 缓存有效期（秒）
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._entries: "OrderedDict[Hashable, tuple[float, T]]" = OrderedDict()  # key -> (过期时间, 值)
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[T]:
+        """查找缓存项，不存在或已过期时返回 None"""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def add(self, key: Hashable, value: T):
+        """写入缓存，满时淘汰最久未使用的一项"""
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,58 @@
+"""
+sentence-transformers embedding 函数 - 在本进程内用 PyTorch 计算向量，有 GPU 时在 GPU 上以 bf16 推理
+"""
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+try:
+    import torch
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+
+# 默认模型（与 minilm 后端相同的 all-MiniLM-L6-v2）
+SENTENCE_TRANSFORMER_MODEL = "all-MiniLM-L6-v2"
+
+# encode 的批大小
+SENTENCE_TRANSFORMER_BATCH_SIZE = 64
+
+
+class SentenceTransformerEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    sentence-transformers 模型的 embedding 函数
+
+    模型只加载一次，VectorStore 的三个集合和查询向量计算共用同一个实例；
+    CUDA 可用时模型转为 bf16 放在 GPU 上，否则以 float32 在 CPU 上运行。
+    """
+
+    def __init__(
+        self,
+        model_name: str = SENTENCE_TRANSFORMER_MODEL,
+        batch_size: int = SENTENCE_TRANSFORMER_BATCH_SIZE
+    ):
+        """
+        Args:
+            model_name: sentence-transformers 模型名称或本地路径
+            batch_size: encode 的批大小
+        """
+        if SentenceTransformer is None:
+            raise ImportError(
+                "sentence_transformers 后端需要安装 sentence-transformers: pip install sentence-transformers"
+            )
+        self.model_name = model_name
+        self.batch_size = batch_size
+
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        self._model = SentenceTransformer(model_name, device=device)
+        if device == "cuda":
+            self._model = self._model.to(torch.bfloat16)
+
+    def __call__(self, input: Documents) -> Embeddings:
+        embeddings = self._model.encode(
+            list(input),
+            batch_size=self.batch_size,
+            convert_to_tensor=True,
+            normalize_embeddings=True
+        )
+        # numpy 不支持 bf16，先在设备上转为 float32 再取回
+        return embeddings.float().cpu().numpy().tolist()
@@ -0,0 +1,46 @@
+"""
+TEI embedding 函数 - 调用 text-embeddings-inference 服务（可部署在 GPU 上）计算向量
+"""
+from typing import List
+
+import httpx
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+
+# TEI 默认的单次请求最大条数（服务端 --max-client-batch-size）
+TEI_BATCH_SIZE = 32
+
+# 单次请求超时（秒），大批量写入时首个请求可能包含模型预热
+TEI_TIMEOUT = 60.0
+
+
+class TEIEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    text-embeddings-inference 服务的 embedding 函数
+
+    与 Chroma 内置函数接口一致，可直接作为集合的 embedding 函数；
+    使用长连接按 TEI_BATCH_SIZE 分批请求 /embed，向量由服务端 L2 归一化。
+    """
+
+    def __init__(self, url: str = "http://localhost:8080", batch_size: int = TEI_BATCH_SIZE):
+        """
+        Args:
+            url: TEI 服务地址
+            batch_size: 单次请求的最大文本数（不超过服务端 --max-client-batch-size）
+        """
+        self.url = url.rstrip("/")
+        self.batch_size = batch_size
+        # 向量计算均在线程池中执行，使用同步客户端；httpx.Client 线程安全，连接复用
+        self._client = httpx.Client(base_url=self.url, timeout=TEI_TIMEOUT)
+
+    def __call__(self, input: Documents) -> Embeddings:
+        embeddings: List[List[float]] = []
+        for start in range(0, len(input), self.batch_size):
+            response = self._client.post("/embed", json={
+                "inputs": input[start:start + self.batch_size],
+                "normalize": True,
+                "truncate": True
+            })
+            response.raise_for_status()
+            embeddings.extend(response.json())
+        return embeddings
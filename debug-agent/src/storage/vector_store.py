@@ -1,23 +1,88 @@
 """
 向量存储 - 使用 ChromaDB 存储代码和历史 Case 的向量
 """
+import hashlib
 import os
-from typing import List, Dict, Any, Optional
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Union
 from pathlib import Path
 
 import chromadb
+import numpy as np
+import orjson
 from chromadb.config import Settings as ChromaSettings
+from chromadb.utils import embedding_functions
+
+
+# 查询向量缓存容量
+QUERY_CACHE_SIZE = 2048
+
+# 批量写入时每次 add 调用的最大条数（Chroma 每次 add 都是一次 SQLite 事务）
+ADD_BATCH_SIZE = 1024
+
+# 已写入的历史 Case 内容哈希文件（每条 16 字节 BLAKE2b 摘要，追加写入）
+CASE_HASHES_FILE = "case_hashes.bin"
+CASE_HASH_SIZE = 16
+
+# 历史 Case 的 ID -> 内容/元数据 旁路表，按 ID 读取时不经过向量库
+CASES_KV_FILE = "cases_kv.sqlite"
+
+# 地址、行号、ID 等数字不影响语义，归一化后共用缓存
+_QUERY_NORMALIZE_PATTERN = re.compile(r"0x[0-9a-f]+|\d+")
+
+
+# Chroma 集合的描述信息
+COLLECTION_DESCRIPTIONS = {
+    "code_snippets": "Code snippets from copilot-server",
+    "history_cases": "Historical debug cases",
+    "log_patterns": "Known error log patterns"
+}
+
+# Chroma 集合的 HNSW 参数（只在创建集合时生效，修改后需重建知识库）
+# 日志模式集合小、看重召回，加大 search_ef；代码片段集合大，降低 search_ef 换取延迟
+COLLECTION_HNSW_PARAMS = {
+    "code_snippets": {"hnsw:M": 32, "hnsw:construction_ef": 200, "hnsw:search_ef": 40},
+    "history_cases": {"hnsw:M": 32, "hnsw:construction_ef": 200, "hnsw:search_ef": 80},
+    "log_patterns": {"hnsw:M": 16, "hnsw:construction_ef": 200, "hnsw:search_ef": 128}
+}
+
+
+def normalize_query(text: str) -> str:
+    """归一化查询文本：去首尾空白、转小写，数字和十六进制地址替换为 <N>"""
+    return _QUERY_NORMALIZE_PATTERN.sub("<N>", text.strip().lower())
 
 
 class VectorStore:
     """向量数据库封装"""
     
-    def __init__(self, persist_directory: str = "./data/chroma"):
+    def __init__(
+        self,
+        persist_directory: str = "./data/chroma",
+        embedding_backend: str = "minilm",
+        openai_api_key: Optional[str] = None,
+        openai_base_url: Optional[str] = None,
+        embedding_model: str = "text-embedding-3-small",
+        tei_url: str = "http://localhost:8080",
+        vector_backend: str = "chroma",
+        faiss_index_type: str = "flat",
+        binary_log_patterns: bool = False
+    ):
         """
         初始化向量存储
         
         Args:
             persist_directory: 持久化目录
+            embedding_backend: embedding 后端，minilm（本地模型）、sentence_transformers（本地 PyTorch，可用 GPU）、openai 或 tei（text-embeddings-inference 服务）
+            openai_api_key: OpenAI API Key（openai 后端使用）
+            openai_base_url: OpenAI API 基础 URL（openai 后端使用）
+            embedding_model: OpenAI embedding 模型名称（openai 后端使用）
+            tei_url: text-embeddings-inference 服务地址（tei 后端使用）
+            vector_backend: 向量后端，chroma 或 faiss（三个集合均使用 FAISS 索引，绕过 Chroma 的 SQLite 读写）
+            faiss_index_type: faiss 后端的索引类型，flat（float32 精确）、sq8（int8 量化粗筛 + float32 精排）、hnsw（HNSW 图近似检索）或 hnsw_sq8（HNSW + int8 编码）
+            binary_log_patterns: faiss 后端下日志模式集合改用二值量化索引（符号位 + 汉明距离）
         """
         self.persist_directory = persist_directory
         Path(persist_directory).mkdir(parents=True, exist_ok=True)
@@ -27,66 +92,193 @@ class VectorStore:
             settings=ChromaSettings(anonymized_telemetry=False)
         )
         
+        # 所有集合共用同一个 embedding 函数，也用于在 Chroma 之外预先计算向量
+        self.embedding_backend = embedding_backend
+        if embedding_backend == "openai":
+            self.embedding_function = embedding_functions.OpenAIEmbeddingFunction(
+                api_key=openai_api_key,
+                model_name=embedding_model,
+                api_base=openai_base_url
+            )
+            self.embedding_model = embedding_model
+        elif embedding_backend == "minilm":
+            # Chroma 内置的 all-MiniLM-L6-v2（ONNX，本地 CPU 推理）
+            self.embedding_function = embedding_functions.DefaultEmbeddingFunction()
+            self.embedding_model = "all-MiniLM-L6-v2"
+        elif embedding_backend == "sentence_transformers":
+            # 与 minilm 相同的模型，由 PyTorch 推理（CUDA 可用时在 GPU 上以 bf16 运行）
+            from .sentence_transformer_embedding import SentenceTransformerEmbeddingFunction
+            self.embedding_function = SentenceTransformerEmbeddingFunction()
+            self.embedding_model = f"sentence-transformers/{self.embedding_function.model_name}"
+        elif embedding_backend == "tei":
+            # 模型由 TEI 服务端决定（可部署在 GPU 上），以服务地址区分缓存命名空间
+            from .tei_embedding import TEIEmbeddingFunction
+            self.embedding_function = TEIEmbeddingFunction(tei_url)
+            self.embedding_model = f"tei:{tei_url}"
+        else:
+            raise ValueError(f"不支持的 embedding 后端: {embedding_backend}")
+        
+        if vector_backend not in ("chroma", "faiss"):
+            raise ValueError(f"不支持的向量后端: {vector_backend}")
+        self.vector_backend = vector_backend
+        self.faiss_index_type = faiss_index_type
+        self.binary_log_patterns = binary_log_patterns
+        
+        # 每个实例独立的查询向量 LRU 缓存（键为归一化后的查询文本）
+        # 检索在线程池中执行，读写缓存需要加锁
+        self._query_cache: OrderedDict[str, List[float]] = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        self._query_cache_hits = 0
+        self._query_cache_misses = 0
+        
+        # 写入代数：每次写入或清空集合后递增，上层的检索结果缓存据此失效
+        self.generation = 0
+        
+        # 已写入的历史 Case 内容哈希，重放或重复同步的相同内容直接跳过
+        collections_dir = os.path.join(persist_directory, "faiss") if vector_backend == "faiss" else persist_directory
+        Path(collections_dir).mkdir(parents=True, exist_ok=True)
+        self._case_hashes_path = os.path.join(collections_dir, CASE_HASHES_FILE)
+        self._case_hashes = self._load_case_hashes()
+        self._cases_lock = threading.Lock()
+        self._cases_kv = sqlite3.connect(os.path.join(collections_dir, CASES_KV_FILE), check_same_thread=False)
+        self._cases_kv.execute(
+            "CREATE TABLE IF NOT EXISTS cases_kv (id TEXT PRIMARY KEY, content TEXT, metadata_json BLOB)"
+        )
+        self._cases_kv.commit()
+        self._cases_kv_lock = threading.Lock()
+        
         # 初始化集合
         self._init_collections()
     
     def _init_collections(self):
         """初始化向量集合"""
         # 代码片段集合
-        self.code_collection = self.client.get_or_create_collection(
-            name="code_snippets",
-            metadata={"description": "Code snippets from copilot-server"}
-        )
+        self.code_collection = self._create_collection("code_snippets")
         
         # 历史 Case 集合
-        self.case_collection = self.client.get_or_create_collection(
-            name="history_cases",
-            metadata={"description": "Historical debug cases"}
-        )
+        self.case_collection = self._create_collection("history_cases")
         
         # 日志模式集合
-        self.log_pattern_collection = self.client.get_or_create_collection(
-            name="log_patterns",
-            metadata={"description": "Known error log patterns"}
+        self.log_pattern_collection = self._create_collection("log_patterns")
+    
+    def _create_collection(self, name: str):
+        """创建或加载集合（faiss 后端按 faiss_index_type 选择索引）"""
+        if self.vector_backend == "faiss":
+            from .faiss_collection import FaissCollection
+            index_type = self.faiss_index_type
+            if name == "log_patterns" and self.binary_log_patterns:
+                index_type = "binary"
+            return FaissCollection(
+                name=name,
+                persist_directory=os.path.join(self.persist_directory, "faiss"),
+                embedding_function=self.embedding_function,
+                index_type=index_type
+            )
+        return self.client.get_or_create_collection(
+            name=name,
+            metadata={"description": COLLECTION_DESCRIPTIONS[name], **COLLECTION_HNSW_PARAMS[name]},
+            embedding_function=self.embedding_function
         )
     
+    def persist(self):
+        """将内存中的 FAISS 索引写入磁盘（Chroma 自动持久化，无需处理）"""
+        if self.vector_backend == "faiss":
+            self.code_collection.persist()
+            self.case_collection.persist()
+            self.log_pattern_collection.persist()
+    
+    def close(self):
+        """关闭历史 Case 旁路表"""
+        with self._cases_kv_lock:
+            self._cases_kv.close()
+    
+    # ============ 向量计算 ============
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """使用集合的 embedding 函数批量计算向量"""
+        return self.embedding_function(texts)
+    
+    def embed_query(self, text: str) -> List[float]:
+        """计算查询向量（按归一化文本缓存，重复的错误信息不再重新计算）"""
+        return self.embed_queries([text])[0]
+    
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        批量计算查询向量，未命中缓存的文本去重后一次性批量计算
+        
+        Args:
+            texts: 查询文本列表
+            
+        Returns:
+            与 texts 一一对应的向量列表
+        """
+        normalized = [normalize_query(t) for t in texts]
+        
+        found = {}
+        with self._query_cache_lock:
+            for key in normalized:
+                embedding = self._query_cache.get(key)
+                if embedding is not None:
+                    self._query_cache.move_to_end(key)
+                    found[key] = embedding
+        
+        # 归一化文本只作缓存键，向量按该键首次出现的原始文本计算（保留状态码等数字信息）
+        missing = {}
+        for key, text in zip(normalized, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            computed = self.embedding_function(list(missing.values()))
+            found.update(zip(missing, computed))
+        
+        with self._query_cache_lock:
+            for key in missing:
+                self._query_cache[key] = found[key]
+            while len(self._query_cache) > QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+            self._query_cache_misses += len(missing)
+            self._query_cache_hits += len(normalized) - len(missing)
+        
+        return [found[key] for key in normalized]
+    
+    def stats(self) -> Dict[str, Any]:
+        """查询向量缓存统计"""
+        hits, misses = self._query_cache_hits, self._query_cache_misses
+        lookups = hits + misses
+        return {
+            "query_cache_hits": hits,
+            "query_cache_misses": misses,
+            "query_cache_size": len(self._query_cache),
+            "query_cache_hit_rate": hits / lookups if lookups else 0.0
+        }
+    
     # ============ 代码相关操作 ============
     
     def add_code_snippets(
         self,
         snippets: List[Dict[str, Any]],
-        embeddings: Optional[List[List[float]]] = None
+        embeddings: Optional[Union[List[List[float]], np.ndarray]] = None
     ):
         """
         添加代码片段
         
         Args:
             snippets: 代码片段列表，每个包含 id, content, metadata
-            embeddings: 可选的预计算向量
+            embeddings: 可选的预计算向量（列表或 (N, d) 矩阵）
         """
         ids = [s["id"] for s in snippets]
         documents = [s["content"] for s in snippets]
         metadatas = [s.get("metadata", {}) for s in snippets]
         
-        if embeddings:
-            self.code_collection.add(
-                ids=ids,
-                documents=documents,
-                metadatas=metadatas,
-                embeddings=embeddings
-            )
-        else:
-            self.code_collection.add(
-                ids=ids,
-                documents=documents,
-                metadatas=metadatas
-            )
+        self._add_in_batches(self.code_collection, ids, documents, metadatas, embeddings)
+        self.generation += 1
     
     def search_code(
         self,
         query: str,
         n_results: int = 5,
-        where: Optional[Dict] = None
+        where: Optional[Dict] = None,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict[str, Any]]:
         """
         搜索代码片段
@@ -95,12 +287,15 @@ class VectorStore:
             query: 查询文本
             n_results: 返回结果数量
             where: 过滤条件
+            query_embedding: 可选的预计算查询向量
             
         Returns:
             匹配的代码片段列表
         """
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
         results = self.code_collection.query(
-            query_texts=[query],
+            query_embeddings=[query_embedding],
             n_results=n_results,
             where=where
         )
@@ -112,38 +307,82 @@ class VectorStore:
     def add_cases(
         self,
         cases: List[Dict[str, Any]],
-        embeddings: Optional[List[List[float]]] = None
+        embeddings: Optional[Union[List[List[float]], np.ndarray]] = None
     ):
         """
-        添加历史 Case
+        添加历史 Case（内容已写入过的 Case 跳过）
         
         Args:
             cases: Case 列表，每个包含 id, content, metadata
-            embeddings: 可选的预计算向量
+            embeddings: 可选的预计算向量（列表或 (N, d) 矩阵）
         """
-        ids = [c["id"] for c in cases]
-        documents = [c["content"] for c in cases]
-        metadatas = [c.get("metadata", {}) for c in cases]
-        
-        if embeddings:
-            self.case_collection.add(
-                ids=ids,
-                documents=documents,
-                metadatas=metadatas,
-                embeddings=embeddings
-            )
-        else:
-            self.case_collection.add(
-                ids=ids,
-                documents=documents,
-                metadatas=metadatas
-            )
+        with self._cases_lock:
+            hashes = [self.case_content_hash(c["content"]) for c in cases]
+            new = self._new_case_indices(hashes)
+            if not new:
+                return
+            if len(new) < len(cases):
+                cases = [cases[i] for i in new]
+                if embeddings is not None:
+                    embeddings = np.asarray(embeddings, dtype=np.float32)[new]
+            
+            ids = [c["id"] for c in cases]
+            documents = [c["content"] for c in cases]
+            metadatas = [c.get("metadata", {}) for c in cases]
+            
+            self._add_in_batches(self.case_collection, ids, documents, metadatas, embeddings)
+            self._record_case_hashes([hashes[i] for i in new])
+            # 与向量库一致：已存在的 ID 保留原内容
+            with self._cases_kv_lock:
+                self._cases_kv.executemany(
+                    "INSERT OR IGNORE INTO cases_kv (id, content, metadata_json) VALUES (?, ?, ?)",
+                    [(id_, document, orjson.dumps(metadata)) for id_, document, metadata in zip(ids, documents, metadatas)]
+                )
+                self._cases_kv.commit()
+        self.generation += 1
+    
+    @staticmethod
+    def case_content_hash(content: str) -> bytes:
+        """历史 Case 内容的 BLAKE2b 摘要"""
+        return hashlib.blake2b(content.encode("utf-8"), digest_size=CASE_HASH_SIZE).digest()
+    
+    def new_case_indices(self, contents: List[str]) -> List[int]:
+        """返回尚未写入过的 Case 内容下标（同一批中重复的内容只保留第一条）"""
+        hashes = [self.case_content_hash(content) for content in contents]
+        with self._cases_lock:
+            return self._new_case_indices(hashes)
+    
+    def _new_case_indices(self, hashes: List[bytes]) -> List[int]:
+        """按哈希筛选未写入过的下标（调用方持有锁）"""
+        seen = set()
+        new = []
+        for i, content_hash in enumerate(hashes):
+            if content_hash in self._case_hashes or content_hash in seen:
+                continue
+            seen.add(content_hash)
+            new.append(i)
+        return new
+    
+    def _load_case_hashes(self) -> set:
+        """从磁盘加载已写入的 Case 内容哈希"""
+        if not os.path.exists(self._case_hashes_path):
+            return set()
+        with open(self._case_hashes_path, "rb") as f:
+            data = f.read()
+        return {data[i:i + CASE_HASH_SIZE] for i in range(0, len(data) - CASE_HASH_SIZE + 1, CASE_HASH_SIZE)}
+    
+    def _record_case_hashes(self, hashes: List[bytes]):
+        """记录新写入的 Case 内容哈希（调用方持有锁）"""
+        self._case_hashes.update(hashes)
+        with open(self._case_hashes_path, "ab") as f:
+            f.write(b"".join(hashes))
     
     def search_cases(
         self,
         query: str,
         n_results: int = 5,
-        where: Optional[Dict] = None
+        where: Optional[Dict] = None,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict[str, Any]]:
         """
         搜索相似历史 Case
@@ -152,12 +391,15 @@ class VectorStore:
             query: 查询文本
             n_results: 返回结果数量
             where: 过滤条件
+            query_embedding: 可选的预计算查询向量
             
         Returns:
             匹配的 Case 列表
         """
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
         results = self.case_collection.query(
-            query_texts=[query],
+            query_embeddings=[query_embedding],
             n_results=n_results,
             where=where
         )
@@ -165,7 +407,14 @@ class VectorStore:
         return self._format_results(results)
     
     def get_case_by_id(self, case_id: str) -> Optional[Dict[str, Any]]:
-        """根据 ID 获取 Case"""
+        """根据 ID 获取 Case（先查旁路表，未命中时回退到向量库，兼容旁路表建立前写入的 Case）"""
+        with self._cases_kv_lock:
+            row = self._cases_kv.execute(
+                "SELECT content, metadata_json FROM cases_kv WHERE id = ?", (case_id,)
+            ).fetchone()
+        if row is not None:
+            return {"id": case_id, "content": row[0], "metadata": orjson.loads(row[1])}
+        
         results = self.case_collection.get(ids=[case_id])
         if results["ids"]:
             return {
@@ -191,20 +440,20 @@ class VectorStore:
             for p in patterns
         ]
         
-        self.log_pattern_collection.add(
-            ids=ids,
-            documents=documents,
-            metadatas=metadatas
-        )
+        self._add_in_batches(self.log_pattern_collection, ids, documents, metadatas)
+        self.generation += 1
     
     def search_log_patterns(
         self,
         error_text: str,
-        n_results: int = 3
+        n_results: int = 3,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict[str, Any]]:
-        """搜索匹配的日志错误模式"""
+        """搜索匹配的日志错误模式（可传入预计算的查询向量）"""
+        if query_embedding is None:
+            query_embedding = self.embed_query(error_text)
         results = self.log_pattern_collection.query(
-            query_texts=[error_text],
+            query_embeddings=[query_embedding],
             n_results=n_results
         )
         
@@ -212,26 +461,55 @@ class VectorStore:
     
     # ============ 工具方法 ============
     
+    @staticmethod
+    def _add_in_batches(
+        collection,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        embeddings: Optional[Union[List[List[float]], np.ndarray]] = None
+    ):
+        """按 ADD_BATCH_SIZE 分批写入集合，每批一次 add 调用（预计算向量统一为连续 float32 矩阵后按行切片）"""
+        if embeddings is not None:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+        for start in range(0, len(ids), ADD_BATCH_SIZE):
+            end = start + ADD_BATCH_SIZE
+            batch = {
+                "ids": ids[start:end],
+                "documents": documents[start:end],
+                "metadatas": metadatas[start:end]
+            }
+            if embeddings is not None:
+                batch["embeddings"] = embeddings[start:end]
+            collection.add(**batch)
+    
     def _format_results(self, results: Dict) -> List[Dict[str, Any]]:
-        """格式化查询结果"""
-        formatted = []
-        
+        """格式化查询结果（各字段是否存在只判断一次，逐条 zip 组装）"""
         if not results["ids"] or not results["ids"][0]:
-            return formatted
+            return []
+        
+        ids = results["ids"][0]
+        documents = results["documents"][0] if results["documents"] else [None] * len(ids)
+        metadatas = results["metadatas"][0] if results["metadatas"] else [{} for _ in ids]
+        distances = results["distances"][0] if results.get("distances") else None
         
-        for i, id_ in enumerate(results["ids"][0]):
-            item = {
+        if distances is None:
+            return [
+                {"id": id_, "content": document, "metadata": metadata, "distance": None}
+                for id_, document, metadata in zip(ids, documents, metadatas)
+            ]
+        
+        # 转换距离为相似度分数 (ChromaDB 返回的是 L2 距离)
+        return [
+            {
                 "id": id_,
-                "content": results["documents"][0][i] if results["documents"] else None,
-                "metadata": results["metadatas"][0][i] if results["metadatas"] else {},
-                "distance": results["distances"][0][i] if results.get("distances") else None
+                "content": document,
+                "metadata": metadata,
+                "distance": distance,
+                "similarity": 1 / (1 + distance)
             }
-            # 转换距离为相似度分数 (ChromaDB 返回的是 L2 距离)
-            if item["distance"] is not None:
-                item["similarity"] = 1 / (1 + item["distance"])
-            formatted.append(item)
-        
-        return formatted
+            for id_, document, metadata, distance in zip(ids, documents, metadatas, distances)
+        ]
     
     def get_stats(self) -> Dict[str, int]:
         """获取存储统计"""
@@ -243,21 +521,27 @@ class VectorStore:
     
     def clear_collection(self, collection_name: str):
         """清空指定集合"""
-        if collection_name == "code_snippets":
-            self.client.delete_collection("code_snippets")
-            self.code_collection = self.client.create_collection(
-                name="code_snippets",
-                metadata={"description": "Code snippets from copilot-server"}
-            )
-        elif collection_name == "history_cases":
-            self.client.delete_collection("history_cases")
-            self.case_collection = self.client.create_collection(
-                name="history_cases",
-                metadata={"description": "Historical debug cases"}
-            )
-        elif collection_name == "log_patterns":
-            self.client.delete_collection("log_patterns")
-            self.log_pattern_collection = self.client.create_collection(
-                name="log_patterns",
-                metadata={"description": "Known error log patterns"}
-            )
+        attrs = {
+            "code_snippets": "code_collection",
+            "history_cases": "case_collection",
+            "log_patterns": "log_pattern_collection"
+        }
+        if collection_name not in attrs:
+            return
+        
+        collection = getattr(self, attrs[collection_name])
+        if self.vector_backend == "faiss":
+            collection.reset()
+        elif collection.count() > 0:
+            # 删除后重建集合比按 ID 逐条删除快得多（后者需先取出全部 ID，且逐条更新 HNSW 和 SQLite）；
+            # 空集合（测试、重复重置）无需重建
+            self.client.delete_collection(collection_name)
+            setattr(self, attrs[collection_name], self._create_collection(collection_name))
+        if collection_name == "history_cases":
+            with self._cases_lock:
+                self._case_hashes.clear()
+                open(self._case_hashes_path, "wb").close()
+                with self._cases_kv_lock:
+                    self._cases_kv.execute("DELETE FROM cases_kv")
+                    self._cases_kv.commit()
+        self.generation += 1